@@ -1,30 +1,79 @@
+import io
+import csv
+import gzip
 import logging
+import asyncio
 import datetime
+import discord
 from discord.ext import commands
 from utils import Flipbook
+from utils.permissions import permits, rank_role_id
 
 log = logging.getLogger(f'charfred.{__name__}')
 
 
+def _auditcsv(nodes, groups):
+    """Writes the members x nodes matrix as csv,
+    from members grouped by their row of decisions.
+    """
+
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['member_id', 'member', 'rank'] + nodes)
+    for rankname, row, members in groups:
+        cells = ['1' if allowed else '0' for allowed in row]
+        writer.writerows([member.id, str(member), rankname] + cells for member in members)
+    return out.getvalue().encode()
+
+
 class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.cfg = bot.cfg
+        self.resolver = bot.resolver
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        self.resolver.invalidate(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.resolver.invalidate(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        if before.name != after.name or before.position != after.position:
+            self.resolver.invalidate(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.resolver.invalidate(guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if before.roles != after.roles:
+            self.resolver.invalidate_member(after)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.resolver.invalidate_member(member)
 
     @commands.command(hidden=True)
     @commands.is_owner()
     async def cfgreload(self, ctx):
         """Reload cfg.
 
-        Useful when you edited botcfg.json
-        manually.
-        Will discard all unsaved changes!
+        Useful when you edited botCfg.toml
+        manually, and the change was not picked
+        up automatically.
+        Only what changed in the file is applied,
+        unsaved changes to anything else are kept.
         """
 
-        log.info('Reloading botcfg.json...')
-        await self.cfg.load()
+        log.info('Reloading botCfg.toml...')
+        ops = await self.cfg.reload()
         log.info('Reloaded!')
-        await ctx.sendmarkdown('# Locked and reloaded!')
+        await ctx.sendmarkdown(f'# Locked and reloaded! {len(ops)} change(s) applied.')
 
     @commands.command(hidden=True)
     async def uptime(self, ctx):
@@ -40,6 +89,21 @@ class Admin(commands.Cog):
         log.info(f'Up for {upstr}.')
         await ctx.sendmarkdown(f'# I have been up for {upstr}!')
 
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def msgstats(self, ctx):
+        """Returns how many messages were dropped before
+        building a context, and how many were dispatched.
+        """
+
+        rejected = self.bot.msgs_rejected
+        dispatched = self.bot.msgs_dispatched
+        total = rejected + dispatched
+        share = (rejected / total * 100) if total else 0
+        await ctx.sendmarkdown(f'# Messages since startup: {total}\n'
+                               f'# Rejected early: {rejected} ({share:.1f}%)\n'
+                               f'# Dispatched: {dispatched}')
+
     @commands.group(invoke_without_command=True)
     async def prefix(self, ctx):
         """Bot Prefix commands.
@@ -78,6 +142,7 @@ class Admin(commands.Cog):
             except KeyError:
                 self.cfg['prefix'][str(ctx.guild.id)] = [prefix]
 
+            self.bot.prefixes.invalidate(ctx.guild.id)
             await self.cfg.save()
             await ctx.sendmarkdown(f'# \'{prefix}\' has been registered!')
         else:
@@ -98,6 +163,7 @@ class Admin(commands.Cog):
             except ValueError:
                 await ctx.sendmarkdown('> Prefix unknown.')
             else:
+                self.bot.prefixes.invalidate(ctx.guild.id)
                 await self.cfg.save()
                 await ctx.sendmarkdown(f'# \'{prefix}\' has been unregistered!')
 
@@ -119,7 +185,7 @@ class Admin(commands.Cog):
         nodelist = list(self.cfg['nodes'].items())
         nodelist.sort()
         nodeentries = [f'{k}:\n\t{self._parserole(v)}' for k, v in nodelist]
-        nodeflip = Flipbook(ctx, nodeentries, entries_per_page=12,
+        nodeflip = Flipbook(ctx, nodeentries, pack=True,
                             title='Permission Nodes', close_on_exit=True)
         await nodeflip.flip()
 
@@ -144,10 +210,79 @@ class Admin(commands.Cog):
             if role == 'everyone' or role == 'Everyone':
                 role = '@everyone'
             self.cfg['nodes'][node] = role
+        self.resolver.invalidate_node(node)
         await self.cfg.save()
         log.info(f'{node} was edited.')
         await ctx.sendmarkdown(f'# Edits to {node} saved successfully!')
 
+    def _rankname(self, guild, rank):
+        if rank == 'owner':
+            return 'Owner'
+        if rank is None:
+            return 'No hierarchy role'
+        role_id = rank_role_id(guild, rank)
+        role = guild.get_role(role_id)
+        return role.name if role else str(role_id)
+
+    @permissions.command(hidden=True)
+    @commands.is_owner()
+    @commands.guild_only()
+    async def audit(self, ctx):
+        """Lists who can use which permission nodes in this guild.
+
+        Members are grouped by their highest role in the hierarchy,
+        and every node is only decided once per group.
+        The full matrix of members and nodes is attached as csv.
+        """
+
+        guild = ctx.guild
+        nodes = sorted(self.cfg['nodes'])
+        if not nodes:
+            await ctx.sendmarkdown('< No permission nodes registered! >')
+            return
+
+        log.info(f'Auditing permissions for {guild.id}.')
+        minimums = [self.resolver.minimum(guild, node) for node in nodes]
+        ranks = {}
+        for num, member in enumerate(guild.members, 1):
+            if self.bot.cached_is_owner(member):
+                rank = 'owner'
+            else:
+                # Not memoised, a full pass would just flush the memo.
+                rank = self.resolver.rank(member, memoise=False)
+            ranks.setdefault(rank, []).append(member)
+            if not num % 1000:
+                await asyncio.sleep(0)
+
+        def order(rank):
+            return (rank == 'owner', rank is not None, rank if isinstance(rank, tuple) else ())
+
+        groups = []
+        entries = []
+        for rank in sorted(ranks, key=order, reverse=True):
+            if rank == 'owner':
+                row = [True] * len(nodes)
+            else:
+                row = [permits(minimum, rank) for minimum in minimums]
+            rankname = self._rankname(guild, rank)
+            members = ranks[rank]
+            groups.append((rankname, row, members))
+            allowed = [node for node, ok in zip(nodes, row) if ok]
+            allowed = ', '.join(allowed) if allowed else 'nothing'
+            entries.append(f'{rankname} ({len(members)} members):\n\t{allowed}')
+
+        data = await self.bot.loop.run_in_executor(None, _auditcsv, nodes, groups)
+        filename = f'audit-{guild.id}.csv'
+        if len(data) > guild.filesize_limit:
+            data = await self.bot.loop.run_in_executor(None, gzip.compress, data)
+            filename += '.gz'
+        await ctx.send(file=discord.File(io.BytesIO(data), filename=filename))
+
+        auditflip = Flipbook(ctx, entries, pack=True,
+                             title=f'Permission Audit ({len(guild.members)} members, '
+                             f'{len(nodes)} nodes)')
+        await auditflip.flip()
+
     @permissions.group(invoke_without_command=True, hidden=True)
     async def hierarchy(self, ctx):
         """Role hierarchy commands.
@@ -183,6 +318,7 @@ class Admin(commands.Cog):
         else:
             log.info(f'Adding {role} to hierarchy.')
             self.cfg['hierarchy'].append(role)
+            self.resolver.invalidate()
             await self.cfg.save()
             await ctx.sendmarkdown(f'# {role} added to hierarchy.')
 
@@ -196,6 +332,7 @@ class Admin(commands.Cog):
         else:
             log.info(f'Removing {role} from hierarchy.')
             self.cfg['hierarchy'].remove(role)
+            self.resolver.invalidate()
             await self.cfg.save()
             await ctx.sendmarkdown(f'# {role} removed from hierarchy.')
 
@@ -212,7 +349,7 @@ class Admin(commands.Cog):
         cogcfgs = list(self.cfg['cogcfgs'].items())
         cogcfgs.sort()
         cogcfgentries = [f'{k}:\n\t{v[0]}' for k, v in cogcfgs]
-        cogcfgflip = Flipbook(ctx, cogcfgentries, entries_per_page=12,
+        cogcfgflip = Flipbook(ctx, cogcfgentries, pack=True,
                               title='Cog-specific Configurations')
         await cogcfgflip.flip()
 
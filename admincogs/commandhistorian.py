@@ -7,6 +7,7 @@ from collections import namedtuple
 from discord.errors import Forbidden, NotFound
 from discord.ext import commands
 from utils import SizedDict
+from utils.outbound import schedule, BULK
 
 log = logging.getLogger(f'charfred.{__name__}')
 
@@ -49,7 +50,10 @@ class CommandHistorian(commands.Cog):
         if message.id in self.cmd_map:
             log.info('Deleting previous command output!')
             try:
-                await message.channel.delete_messages(self.cmd_map[message.id].output)
+                await schedule(self.bot, message.channel.id, 'delete',
+                               lambda: message.channel.delete_messages(
+                                   self.cmd_map[message.id].output
+                               ), BULK)
             except KeyError:
                 log.error('Deletion of previous command output failed!')
             except Forbidden:
@@ -74,7 +78,10 @@ class CommandHistorian(commands.Cog):
         if before.id in self.cmd_map:
             log.info('Deleting previous command output!')
             try:
-                await before.channel.delete_messages(self.cmd_map[before.id].output)
+                await schedule(self.bot, before.channel.id, 'delete',
+                               lambda: before.channel.delete_messages(
+                                   self.cmd_map[before.id].output
+                               ), BULK)
             except KeyError:
                 log.error('Deletion of previous command output failed!')
             except Forbidden:
@@ -0,0 +1,118 @@
+import logging
+import asyncio
+from discord.ext import commands
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+
+class TimerWheel:
+    """Hashed timer wheel with a resolution of tick seconds.
+
+    Scheduling, rescheduling and cancelling are O(1); advancing only
+    looks at the slots of the ticks that passed.
+    """
+
+    def __init__(self, loop, slots=256, tick=1.0):
+        self.loop = loop
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.deadlines = {}
+        self.current = self._now()
+
+    def _now(self):
+        return int(self.loop.time() / self.tick)
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, item, delay):
+        """Expires the item in delay seconds, replacing any earlier deadline."""
+
+        self.cancel(item)
+        deadline = max(int((self.loop.time() + delay) / self.tick), self.current + 1)
+        self.deadlines[item] = deadline
+        self.slots[deadline % len(self.slots)].add(item)
+
+    def cancel(self, item):
+        deadline = self.deadlines.pop(item, None)
+        if deadline is not None:
+            self.slots[deadline % len(self.slots)].discard(item)
+
+    def advance(self):
+        """Returns all items that expired since the last advance."""
+
+        now = self._now()
+        steps = min(now - self.current, len(self.slots))
+        expired = []
+        for tick in range(now - steps + 1, now + 1):
+            slot = self.slots[tick % len(self.slots)]
+            # Slots are shared by every deadline a full turn apart.
+            for item in [item for item in slot if self.deadlines[item] <= now]:
+                slot.discard(item)
+                del self.deadlines[item]
+                expired.append(item)
+        self.current = now
+        return expired
+
+
+class FlipbookRouter(commands.Cog):
+    """Dispatches reactions to open Flipbooks by message id and closes
+    idle ones, so any number of Flipbooks costs a single dict lookup per
+    reaction, instead of one wait_for check per Flipbook.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.loop = bot.loop
+        self.books = {}
+        self.wheel = TimerWheel(self.loop)
+        self.ticker = self.loop.create_task(self._tick())
+        bot.flipbooks = self
+
+    def cog_unload(self):
+        self.ticker.cancel()
+        del self.bot.flipbooks
+        for book in list(self.books.values()):
+            self.unregister(book)
+            self.loop.create_task(book.expire())
+
+    def __len__(self):
+        return len(self.books)
+
+    def register(self, book):
+        self.books[book.msg.id] = book
+        self.wheel.schedule(book, book.timeout)
+
+    def unregister(self, book):
+        self.books.pop(book.msg.id, None)
+        self.wheel.cancel(book)
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            for book in self.wheel.advance():
+                self.books.pop(book.msg.id, None)
+                self.loop.create_task(book.expire())
+
+    @commands.Cog.listener()
+    async def on_reaction_add(self, reaction, user):
+        book = self.books.get(reaction.message.id)
+        if book is None:
+            return
+        if not await book.react(reaction, user):
+            return
+        if book.flipable:
+            self.wheel.schedule(book, book.timeout)
+        else:
+            self.unregister(book)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        book = self.books.get(payload.message_id)
+        if book is not None:
+            book.flipable = False
+            self.unregister(book)
+
+
+def setup(bot):
+    bot.add_cog(FlipbookRouter(bot))
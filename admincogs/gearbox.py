@@ -15,7 +15,7 @@ class Gearbox(commands.Cog):
         self.dir = bot.dir
         self.loop = bot.loop
         self.cogfig = Config(f'{self.dir}/configs/cogCfg.json',
-                             load=True, loop=self.loop)
+                             load=True, loop=self.loop, watcher=bot.fswatcher)
         try:
             for cog in self.cogfig['cogs']:
                 self._load(cog)
@@ -222,59 +222,61 @@ class Gearbox(commands.Cog):
     async def addcog(self, ctx, cogname: str):
         """Adds a cog to be loaded on startup."""
 
-        if cogname.startswith('admincogs.'):
-            return
-        if cogname in self.cogfig['cogs']:
-            await ctx.sendmarkdown(f'> \"{cogname}\" already loading on startup!')
-            return
-        candidates = self._searchpaths(cogname)
-        if candidates:
-            if isinstance(candidates, list):
-                await ctx.sendmarkdown(
-                    '< Found multiple matching cogs: >\n' +
-                    "\n".join(candidates) +
-                    '\n< Please be more specific! >'
-                )
+        async with ctx.coalescing():
+            if cogname.startswith('admincogs.'):
+                return
+            if cogname in self.cogfig['cogs']:
+                await ctx.sendmarkdown(f'> \"{cogname}\" already loading on startup!')
                 return
+            candidates = self._searchpaths(cogname)
+            if candidates:
+                if isinstance(candidates, list):
+                    await ctx.sendmarkdown(
+                        '< Found multiple matching cogs: >\n' +
+                        "\n".join(candidates) +
+                        '\n< Please be more specific! >'
+                    )
+                    return
+                else:
+                    cogname = candidates
             else:
-                cogname = candidates
-        else:
-            await ctx.sendmarkdown(f'< Could not add {cogname}, no such cog found! >')
-            return
-        success, reply = self._load(cogname)
-        if success:
-            self.cogfig['cogs'].append(cogname)
-            await self.cogfig.save()
-            await ctx.sendmarkdown(f'# \"{cogname}\" will now be loaded automatically.')
-        await ctx.sendmarkdown(f'# {reply}' if success else f'< {reply} >')
+                await ctx.sendmarkdown(f'< Could not add {cogname}, no such cog found! >')
+                return
+            success, reply = self._load(cogname)
+            if success:
+                self.cogfig['cogs'].append(cogname)
+                await self.cogfig.save()
+                await ctx.sendmarkdown(f'# \"{cogname}\" will now be loaded automatically.')
+            await ctx.sendmarkdown(f'# {reply}' if success else f'< {reply} >')
 
     @cog.command(name='remove')
     @commands.is_owner()
     async def removecog(self, ctx, cogname: str):
         """Removes a cog from being loaded on startup."""
 
-        if cogname not in self.cogfig['cogs']:
-            candidates = []
-            for cog in self.cogfig['cogs']:
-                if cogname in cog:
-                    candidates.append(cog)
-            if candidates:
-                if len(candidates) > 1:
-                    await ctx.sendmarkdown(f'< Multiple matches for {cogname}'
-                                           ' in current loading list, please be'
-                                           ' more specific! >')
-                    return
-                else:
-                    cogname = candidates[0]
-        try:
-            self.cogfig['cogs'].remove(cogname)
-        except ValueError:
-            await ctx.sendmarkdown(f'> {cogname} was not set to load on startup.')
-        else:
-            await self.cogfig.save()
-            await ctx.sendmarkdown(f'# \"{cogname}\" will no longer be loaded automatically.')
-        success, reply = self._unload(cogname)
-        await ctx.sendmarkdown(f'# {reply}' if success else f'< {reply} >')
+        async with ctx.coalescing():
+            if cogname not in self.cogfig['cogs']:
+                candidates = []
+                for cog in self.cogfig['cogs']:
+                    if cogname in cog:
+                        candidates.append(cog)
+                if candidates:
+                    if len(candidates) > 1:
+                        await ctx.sendmarkdown(f'< Multiple matches for {cogname}'
+                                               ' in current loading list, please be'
+                                               ' more specific! >')
+                        return
+                    else:
+                        cogname = candidates[0]
+            try:
+                self.cogfig['cogs'].remove(cogname)
+            except ValueError:
+                await ctx.sendmarkdown(f'> {cogname} was not set to load on startup.')
+            else:
+                await self.cogfig.save()
+                await ctx.sendmarkdown(f'# \"{cogname}\" will no longer be loaded automatically.')
+            success, reply = self._unload(cogname)
+            await ctx.sendmarkdown(f'# {reply}' if success else f'< {reply} >')
 
     @cog.command(aliases=['changeloadorder'])
     @commands.is_owner()
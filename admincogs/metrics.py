@@ -0,0 +1,257 @@
+import logging
+import asyncio
+from time import perf_counter
+from discord.ext import commands
+from utils import Flipbook, MetricsRegistry, format_latency, lazy_import
+from utils.metrics import render_family, render_histograms, render_commands
+from utils.outbound import PRIORITIES
+
+psutil = lazy_import('psutil')
+web = lazy_import('aiohttp.web')
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+
+def getProcStats(proc):
+    """Collects the process stats Quartermaster reports, minus the
+    cpu sampling; cpu usage is measured since the previous call instead.
+    """
+
+    with proc.oneshot():
+        memory = proc.memory_full_info()
+        return {
+            'cpu_percent': proc.cpu_percent(interval=None),
+            'num_threads': proc.num_threads(),
+            'rss': memory.rss,
+            'vms': memory.vms,
+            'uss': memory.uss,
+            'swap': getattr(memory, 'swap', 0)
+        }
+
+
+class Metrics(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.loop = bot.loop
+        self.cfg = bot.cfg
+        if not hasattr(bot, 'registry'):
+            self.registry = MetricsRegistry()
+            bot.registry = self.registry
+        else:
+            self.registry = bot.registry
+        self.looplag = 0.0
+        self.process = None
+        self.runner = None
+        self.lagsampler = self.loop.create_task(self._sample_lag())
+        self.loop.create_task(self._start_endpoint())
+
+    def cog_unload(self):
+        self.lagsampler.cancel()
+        if self.runner:
+            log.info('Closing metrics endpoint.')
+            self.loop.create_task(self.runner.cleanup())
+
+    def _elapsed(self, ctx):
+        try:
+            return perf_counter() - ctx.invoked_at
+        except AttributeError:
+            return None
+
+    async def _sample_lag(self):
+        while True:
+            start = self.loop.time()
+            await asyncio.sleep(1)
+            self.looplag = self.loop.time() - start - 1
+
+    async def _start_endpoint(self):
+        """Starts the endpoint on the configured port, if there is one;
+        returns the error if the port could not be bound, None otherwise.
+        """
+
+        if self.runner:
+            log.info('Metrics endpoint already running!')
+            return None
+
+        port = self.cfg.get('metricsport')
+        if not port:
+            return None
+
+        app = web.Application()
+        app.router.add_get('/metrics', self._scrape)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', port)
+        try:
+            await site.start()
+        except OSError as e:
+            log.error(f'Could not start metrics endpoint on 127.0.0.1:{port}: {e}')
+            await self.runner.cleanup()
+            self.runner = None
+            return e
+        log.info(f'Metrics endpoint listening on 127.0.0.1:{port}.')
+        return None
+
+    async def _stop_endpoint(self):
+        if self.runner:
+            log.info('Closing metrics endpoint.')
+            await self.runner.cleanup()
+            self.runner = None
+
+    def _render_gauges(self, procstats):
+        bot = self.bot
+        families = [
+            ('charfred_event_loop_lag_seconds', 'gauge',
+             'Event loop lag, sampled once a second.', self.looplag),
+            ('charfred_gateway_latency_seconds', 'gauge',
+             'Discord gateway heartbeat latency.', bot.latency),
+            ('charfred_cmd_map_size', 'gauge',
+             'Commands held in the command map.', len(getattr(bot, 'cmd_map', ()))),
+            ('charfred_messages_rejected_total', 'counter',
+             'Messages rejected before building a context.', bot.msgs_rejected),
+            ('charfred_messages_dispatched_total', 'counter',
+             'Messages dispatched for command processing.', bot.msgs_dispatched),
+            ('charfred_process_cpu_percent', 'gauge',
+             'Process cpu usage since the previous scrape.', procstats['cpu_percent']),
+            ('charfred_process_threads', 'gauge',
+             'Process thread count.', procstats['num_threads'])
+        ]
+        for key in ('rss', 'vms', 'uss', 'swap'):
+            families.append((f'charfred_process_memory_{key}_bytes', 'gauge',
+                             f'Process memory, {key}.', procstats[key]))
+        watchdog = getattr(bot, 'watchdog', None)
+        if watchdog:
+            families.append(('charfred_event_loop_stalls_total', 'counter',
+                             'Event loop stalls caught by the watchdog.', watchdog.total))
+        outbound = getattr(bot, 'outbound', None)
+        if outbound:
+            families.extend([
+                ('charfred_outbound_queue_depth', 'gauge',
+                 'Requests queued in the outbound scheduler.', outbound.depth),
+                ('charfred_outbound_submitted_total', 'counter',
+                 'Requests submitted to the outbound scheduler.', outbound.submitted),
+                ('charfred_outbound_superseded_total', 'counter',
+                 'Queued requests dropped for a newer one.', outbound.superseded)
+            ])
+        streamserver = bot.get_cog('StreamServer')
+        if streamserver:
+            families.extend([
+                ('charfred_streamserver_up', 'gauge',
+                 'Whether the stream server is serving.', int(streamserver.running)),
+                ('charfred_streamserver_connections_total', 'counter',
+                 'Connections accepted by the stream server.', streamserver.accepted),
+                ('charfred_streamserver_handoffs_total', 'counter',
+                 'Connections handed off to a registered handler.', streamserver.handed_off)
+            ])
+        rendered = ''.join(render_family(name, kind, helptext, [('', value)])
+                           for name, kind, helptext, value in families)
+        if outbound:
+            rendered += render_histograms(
+                'charfred_outbound_wait_seconds', 'Time requests spent queued.',
+                [(f'priority="{PRIORITIES[priority]}"', hist)
+                 for priority, hist in outbound.waits.items()]
+            )
+        return rendered
+
+    async def _scrape(self, request):
+        if self.process is None:
+            self.process = psutil.Process()
+        procstats = await self.loop.run_in_executor(None, getProcStats, self.process)
+        resp = web.StreamResponse(headers={'Content-Type': 'text/plain; version=0.0.4'})
+        await resp.prepare(request)
+        await resp.write(self._render_gauges(procstats).encode())
+        for chunk in render_commands(self.registry):
+            await resp.write(chunk.encode())
+        await resp.write_eof()
+        return resp
+
+    @commands.Cog.listener()
+    async def on_command(self, ctx):
+        self.registry.started(ctx.command.qualified_name)
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        elapsed = self._elapsed(ctx)
+        if elapsed is not None:
+            self.registry.completed(ctx.command.qualified_name, elapsed)
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx, error):
+        if ctx.command is None:
+            return
+        elapsed = self._elapsed(ctx)
+        if elapsed is not None:
+            self.registry.failed(ctx.command.qualified_name, elapsed)
+
+    @commands.group(invoke_without_command=True, hidden=True)
+    @commands.is_owner()
+    async def metrics(self, ctx):
+        """Command metrics commands.
+
+        This returns call counts, failures and latency percentiles
+        for every command invoked since startup, slowest first,
+        if no subcommand was given.
+        """
+
+        if not self.registry:
+            await ctx.sendmarkdown('> No commands recorded yet!')
+            return
+
+        log.info('Listing command metrics.')
+        ranked = sorted(self.registry,
+                        key=lambda item: item[1].latency.percentile(95) or 0,
+                        reverse=True)
+        entries = []
+        for name, stats in ranked:
+            p50, p95, p99 = (format_latency(stats.latency.percentile(p))
+                             for p in (50, 95, 99))
+            entries.append(f'{name}:\n\t{stats.calls} calls, {stats.failed} failed\n'
+                           f'\tp50 {p50}, p95 {p95}, p99 {p99}')
+        metricflip = Flipbook(ctx, entries, entries_per_page=8,
+                              title='Command Metrics')
+        await metricflip.flip()
+
+    @metrics.command(hidden=True)
+    @commands.is_owner()
+    async def reset(self, ctx):
+        """Resets all command metrics."""
+
+        log.info('Resetting command metrics.')
+        self.registry.reset()
+        await ctx.sendmarkdown('# Command metrics reset!')
+
+    @metrics.command(hidden=True)
+    @commands.is_owner()
+    async def setport(self, ctx, port: int):
+        """Set the local port to serve Prometheus metrics on,
+        and (re)start the endpoint.
+
+        The endpoint only ever listens on 127.0.0.1.
+        """
+
+        if not 0 < port < 65536:
+            await ctx.sendmarkdown('< Ports go from 1 to 65535! >')
+            return
+        self.cfg['metricsport'] = port
+        await self.cfg.save()
+        await self._stop_endpoint()
+        error = await self._start_endpoint()
+        if error is not None:
+            await ctx.sendmarkdown(f'< Could not serve metrics on 127.0.0.1:{port}: '
+                                   f'{error.strerror or error} >')
+            return
+        await ctx.sendmarkdown(f'# Serving metrics on 127.0.0.1:{port}/metrics!')
+
+    @metrics.command(hidden=True)
+    @commands.is_owner()
+    async def disable(self, ctx):
+        """Stop the metrics endpoint and remove its port from the config."""
+
+        await self._stop_endpoint()
+        if 'metricsport' in self.cfg:
+            del self.cfg['metricsport']
+            await self.cfg.save()
+        await ctx.sendmarkdown('# Metrics endpoint disabled!')
+
+
+def setup(bot):
+    bot.add_cog(Metrics(bot))
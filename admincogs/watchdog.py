@@ -0,0 +1,99 @@
+import logging
+from discord.ext import commands
+from utils import Flipbook, LoopWatchdog
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+
+class Watchdog(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.loop = bot.loop
+        self.cfg = bot.cfg
+        self.watchdog = LoopWatchdog(self.loop, threshold=self._threshold())
+        bot.watchdog = self.watchdog
+        # Only start watching once the loop actually runs.
+        self.loop.call_soon(self.watchdog.start)
+
+    def cog_unload(self):
+        self.watchdog.stop()
+        del self.bot.watchdog
+
+    def _threshold(self):
+        try:
+            return float(self.cfg['cogcfgs'][f'{__name__}.threshold'][0])
+        except (KeyError, TypeError, ValueError):
+            return 0.5
+
+    @commands.group(invoke_without_command=True, hidden=True)
+    @commands.is_owner()
+    async def stalls(self, ctx):
+        """Event loop stall commands.
+
+        This returns a list of the most recent stalls,
+        if no subcommand was given.
+        """
+
+        stalls = self.watchdog.recent()
+        if not stalls:
+            await ctx.sendmarkdown('# No stalls recorded, smooth sailing!')
+            return
+
+        log.info('Listing event loop stalls.')
+        entries = []
+        for num, stall in enumerate(stalls):
+            lastline = stall.stack.rstrip().splitlines()[-2:]
+            lastline = '\n\t'.join(line.strip() for line in lastline)
+            entries.append(f'{num}: {stall.when:%Y-%m-%d %H:%M:%S}, '
+                           f'{stall.duration:.3f}s:\n\t{lastline}')
+        stallflip = Flipbook(ctx, entries, entries_per_page=6,
+                             title=f'Event Loop Stalls ({self.watchdog.total} total, '
+                             f'threshold {self.watchdog.threshold}s)')
+        await stallflip.flip()
+
+    @stalls.command(hidden=True)
+    @commands.is_owner()
+    async def show(self, ctx, num: int=0):
+        """Returns the full stack of a recorded stall,
+        counting from the most recent one.
+        """
+
+        try:
+            stall = self.watchdog.recent()[num]
+        except IndexError:
+            await ctx.sendmarkdown('< No such stall recorded! >')
+            return
+        await ctx.send(f'```py\n# {stall.when:%Y-%m-%d %H:%M:%S}, '
+                       f'stalled for {stall.duration:.3f}s:\n{stall.stack}\n```',
+                       codeblocked=True)
+
+    @stalls.command(hidden=True)
+    @commands.is_owner()
+    async def clear(self, ctx):
+        """Clears all recorded stalls."""
+
+        self.watchdog.clear()
+        await ctx.sendmarkdown('# Recorded stalls cleared!')
+
+    @stalls.command(hidden=True)
+    @commands.is_owner()
+    async def threshold(self, ctx, seconds: float):
+        """Set the stall threshold in seconds."""
+
+        if seconds <= 0:
+            await ctx.sendmarkdown('< The threshold has to be positive! >')
+            return
+        self.cfg['cogcfgs'][f'{__name__}.threshold'] = (
+            str(seconds), self.cfg['cogcfgs'][f'{__name__}.threshold'][1]
+        )
+        await self.cfg.save()
+        self.watchdog.threshold = seconds
+        log.info(f'Stall threshold set to {seconds}s.')
+        await ctx.sendmarkdown(f'# Stall threshold set to {seconds}s!')
+
+
+def setup(bot):
+    bot.register_cfg(f'{__name__}.threshold',
+                     'Enter the number of seconds the event loop may be blocked '
+                     'for before it is recorded as a stall.', '0.5')
+    bot.add_cog(Watchdog(bot))
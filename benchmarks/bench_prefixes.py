@@ -0,0 +1,142 @@
+"""Times config loading, prefix matching and permission node checks
+on a config with thousands of guild prefixes and nodes, against the
+implementations they replaced.
+
+Run from the repository root: python benchmarks/bench_prefixes.py
+"""
+
+import os
+import sys
+import copy
+import random
+import tempfile
+from timeit import timeit
+from types import SimpleNamespace as NS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+from utils.config import Config  # noqa: E402
+from utils.prefixes import PrefixIndex  # noqa: E402
+from utils.permissions import NodeResolver  # noqa: E402
+
+GUILDS = 5000
+NODES = 3000
+ROLES = 200
+LOOKUPS = 20000
+
+
+def _old_get_prefixes(bot, msg):
+    """Prefixes as they were listed for every message, before PrefixIndex."""
+
+    bot_id = bot.user.id
+    prefixes = [f'<@{bot_id}> ', f'<@!{bot_id}> ']
+    if msg.guild:
+        try:
+            prefixes.extend(bot.cfg['prefix'][str(msg.guild.id)])
+        except KeyError:
+            pass
+    return prefixes
+
+
+def _old_match(bot, msg):
+    for prefix in _old_get_prefixes(bot, msg):
+        if msg.content.startswith(prefix):
+            return prefix
+    return None
+
+
+def _old_allowed(cfg, guild, member, node):
+    """Permission check as it was before roles were indexed."""
+
+    roleName = cfg['nodes'].get(node)
+    if not roleName:
+        return False
+    if roleName == '@everyone':
+        return True
+    minRole = discord.utils.find(lambda r: r.name == roleName, guild.roles)
+    if minRole:
+        hierarchy = set(cfg['hierarchy'])
+        roles = [r for r in member.roles if r.name in hierarchy]
+        if roles:
+            return roles[-1] >= minRole
+    return False
+
+
+def _store(rng):
+    return {
+        'prefix': {str(guild_id): [rng.choice('!?$%&'), f'{guild_id}.', 'charfred ']
+                   for guild_id in range(1, GUILDS + 1)},
+        'nodes': {f'cog{num // 20}.node{num}': f'role{rng.randrange(ROLES)}'
+                  for num in range(NODES)},
+        'hierarchy': [f'role{num}' for num in range(0, ROLES, 2)],
+        'cogcfgs': {}
+    }
+
+
+def bench_load(store):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'botCfg.toml')
+        cfg = Config(path)
+        cfg.store = copy.deepcopy(store)
+        cfg._save()
+
+        def parse():
+            os.remove(cfg.cachefile)
+            Config(path, load=True)
+
+        Config(path, load=True)
+        cached = timeit(lambda: Config(path, load=True), number=10) / 10
+        parsed = timeit(parse, number=10) / 10
+    print(f'Config load:        {parsed * 1e3:8.2f}ms parsed, {cached * 1e3:8.2f}ms cached, '
+          f'{parsed / cached:.1f}x')
+
+
+def bench_prefixes(rng, store):
+    bot = NS(user=NS(id=42), cfg=store)
+    index = PrefixIndex(bot)
+    msgs = []
+    for _ in range(LOOKUPS):
+        guild_id = rng.randint(1, GUILDS)
+        prefix = rng.choice(store['prefix'][str(guild_id)] + ['', '<@42> '])
+        msgs.append(NS(guild=NS(id=guild_id), content=f'{prefix}help me'))
+    assert [index.match(msg) for msg in msgs] == [_old_match(bot, msg) for msg in msgs]
+
+    old = timeit(lambda: [_old_match(bot, msg) for msg in msgs], number=5) / 5
+    new = timeit(lambda: [index.match(msg) for msg in msgs], number=5) / 5
+    print(f'Prefix match:       {old / LOOKUPS * 1e6:8.2f}us linear, '
+          f'{new / LOOKUPS * 1e6:8.2f}us indexed, {old / new:.1f}x')
+
+
+def bench_nodes(rng, store):
+    guild = NS(id=10 ** 6)
+    roles = [discord.Role(guild=guild, state=None,
+                          data={'id': guild.id, 'name': '@everyone', 'position': 0})]
+    for num in range(ROLES):
+        roles.append(discord.Role(guild=guild, state=None, data={
+            'id': guild.id + num + 1, 'name': f'role{num}', 'position': num + 1
+        }))
+    guild.roles = roles
+    members = [NS(id=num, guild=guild, roles=sorted(rng.sample(roles, 5)))
+               for num in range(100)]
+    nodes = list(store['nodes'])
+    checks = [(rng.choice(members), rng.choice(nodes)) for _ in range(LOOKUPS)]
+    resolver = NodeResolver(NS(cfg=store))
+    assert [resolver.allowed(member, node) for member, node in checks] == \
+        [_old_allowed(store, guild, member, node) for member, node in checks]
+
+    old = timeit(lambda: [_old_allowed(store, guild, member, node) for member, node in checks],
+                 number=3) / 3
+    new = timeit(lambda: [resolver.allowed(member, node) for member, node in checks],
+                 number=3) / 3
+    print(f'Node check:         {old / LOOKUPS * 1e6:8.2f}us linear, '
+          f'{new / LOOKUPS * 1e6:8.2f}us indexed, {old / new:.1f}x')
+
+
+if __name__ == '__main__':
+    rng = random.Random(11)
+    store = _store(rng)
+    print(f'{GUILDS} guilds with prefixes, {NODES} nodes, {ROLES} roles, {LOOKUPS} lookups')
+    bench_load(store)
+    bench_prefixes(rng, store)
+    bench_nodes(rng, store)
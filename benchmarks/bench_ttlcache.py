@@ -0,0 +1,112 @@
+"""Times inserts, lookups, overwrites and expiry of TTLCache against
+the SimpleTTLDict it replaced.
+
+Run from the repository root: python benchmarks/bench_ttlcache.py
+"""
+
+import os
+import sys
+import time
+from collections import OrderedDict
+from timeit import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.collections import TTLCache  # noqa: E402
+
+ITEMS = 100000
+TTL = 360
+
+
+class Clock:
+    """Settable stand-in for both the wall clock and the monotonic one,
+    so expiry can be timed without sleeping.
+    """
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+clock = Clock()
+
+
+class OldSimpleTTLDict(OrderedDict):
+    """SimpleTTLDict as it was before TTLCache, reading the time
+    from the settable clock instead of time.time().
+    """
+    def __init__(self, ttl_seconds=360):
+        assert ttl_seconds >= 0
+
+        super().__init__(self)
+        self.ttl = ttl_seconds
+
+    def _expire(self):
+        """Deletes all dict items that have outlived their ttl."""
+        now = int(clock())
+        while self:
+            (key, (value, date)) = super().popitem(last=False)
+            if now - date > self.ttl:
+                continue
+            else:
+                super().__setitem__(key, (value, date))
+                super().move_to_end(key, last=False)
+                break
+
+    def __setitem__(self, key, value):
+        """Set d[key] to (value, date), where date is its creation time.
+
+        Also removes all expired entries.
+        """
+        self._expire()
+        super().__setitem__(key, (value, int(clock())))
+        super().move_to_end(key)
+
+    def getvalue(self, key):
+        """Gets the value from a (value, date) tuple of a given key."""
+        return super().__getitem__(key)[0]
+
+
+def _fill(cache):
+    for key in range(ITEMS):
+        cache[key] = key
+
+
+def _lookup(cache):
+    getvalue = cache.getvalue
+    for key in range(ITEMS):
+        getvalue(key)
+
+
+def _overwrite(cache):
+    for key in range(ITEMS):
+        cache[key % 100] = key
+
+
+def _expire(cache):
+    _fill(cache)
+    clock.now += TTL + 1
+    cache['new'] = None
+    assert len(cache) == 1
+
+
+def bench(name, func):
+    results = []
+    for cls in (lambda: OldSimpleTTLDict(TTL), lambda: TTLCache(TTL, clock=clock)):
+        cache = cls()
+        if func is _lookup:
+            _fill(cache)
+        results.append(timeit(lambda: func(cache), number=1))
+    old, new = results
+    print(f'{name:<24}{old / ITEMS * 1e9:8.0f}ns old, {new / ITEMS * 1e9:8.0f}ns new '
+          f'per item, {old / new:.2f}x')
+
+
+if __name__ == '__main__':
+    print(f'{ITEMS} items, ttl {TTL}s')
+    bench('Insert', _fill)
+    bench('Lookup', _lookup)
+    bench('Overwrite 100 keys', _overwrite)
+    bench('Fill and expire', _expire)
@@ -1,3 +1,6 @@
+from time import perf_counter
+_started = perf_counter()
+
 import asyncio
 import click
 import logging
@@ -7,11 +10,16 @@ import datetime
 import aiohttp
 import os
 from pathlib import Path
+from contextlib import contextmanager
 from discord.ext import commands
 from discord import ClientException, Intents
-from utils import Config, CharfredContext
+from utils import Config, CharfredContext, PrefixIndex, PromptRouter, NodeResolver, \
+    make_watcher
+from utils.outbound import OutboundScheduler
+from utils.profiling import StartupTimeline, TimedLoader
 
 log = logging.getLogger('charfred')
+_imported = perf_counter()
 
 
 try:
@@ -21,6 +29,7 @@ except ImportError:
 else:
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     log.info('uvloop imported, oh yeah! *high five*')
+_uvlooped = perf_counter()
 
 description = """
 Charfred is a gentleman and a scholar,
@@ -40,25 +49,34 @@ def _admincogs(direc):
 
 
 def _get_prefixes(bot, msg):
-    bot_id = bot.user.id
-    prefixes = [f'<@{bot_id}> ', f'<@!{bot_id}> ']
-    if msg.guild:
-        try:
-            prefixes.extend(bot.cfg['prefix'][str(msg.guild.id)])
-        except KeyError:
-            pass
-    return prefixes
+    prefix = bot.prefixes.match(msg)
+    if prefix is None:
+        # Nothing matched, so neither will the mention.
+        return bot.prefixes.mentions[0]
+    return prefix
 
 
 class Charfred(commands.Bot):
-    def __init__(self):
+    def __init__(self, timeline=None):
+        self.timeline = timeline
+        if timeline:
+            timeline.record('imports', _started, _imported)
+            timeline.record('import uvloop', _imported, _uvlooped)
+            initstart = perf_counter()
         super().__init__(command_prefix=_get_prefixes, description=description,
                          pm_help=False, intents=Intents.all())
         self.session = aiohttp.ClientSession(loop=self.loop)
+        self.outbound = OutboundScheduler(self.loop)
+        self.prompts = PromptRouter(self.loop)
+        if timeline:
+            timeline.record('client init', initstart, perf_counter())
 
         self.dir = Path(__file__).parent
-        self.cfg = Config(f'{self.dir}/configs/botCfg.toml',
-                          load=True, loop=self.loop)
+        self.fswatcher = make_watcher(self.loop)
+        with self._phase('load botCfg.toml'):
+            self.cfg = Config(f'{self.dir}/configs/botCfg.toml',
+                              load=True, loop=self.loop, watcher=self.fswatcher,
+                              shards=('prefix', 'nodes', 'hierarchy', 'cogcfgs'))
         if 'prefix' not in self.cfg:
             self.cfg['prefix'] = {}
         if 'nodes' not in self.cfg:
@@ -67,22 +85,59 @@ class Charfred(commands.Bot):
             self.cfg['hierarchy'] = []
         if 'cogcfgs' not in self.cfg:
             self.cfg['cogcfgs'] = {}
-        self.cfg._save()
+        self.register_cfg('utils.context.attachment_threshold',
+                          'Enter the number of characters above which command output is '
+                          'sent as an attachment instead of split up, 0 to always split.',
+                          '8000')
+        self.register_cfg('utils.context.attachment_gzip',
+                          'Enter "yes" to gzip output sent as an attachment.', 'no')
+        with self._phase('save botCfg.toml'):
+            self.cfg._save()
 
-        self.keywords = Config(f'{self.dir}/configs/keywords.json',
-                               load=True, loop=self.loop,
-                               default=f'{self.dir}/configs/keywords.json_default')
+        with self._phase('load keywords.json'):
+            self.keywords = Config(f'{self.dir}/configs/keywords.json',
+                                   load=True, loop=self.loop, watcher=self.fswatcher,
+                                   default=f'{self.dir}/configs/keywords.json_default')
+
+        self.prefixes = PrefixIndex(self)
+        self.cfg.subscribe(self.prefixes.cfg_changed)
+        self.resolver = NodeResolver(self)
+        self.cfg.subscribe(self.resolver.cfg_changed)
+        self.msgs_rejected = 0
+        self.msgs_dispatched = 0
 
         try:
             os.chdir(self.dir)
-            for admincog in _admincogs('admincogs'):
-                self.load_extension(admincog.replace('/', '.').replace('\\', '.'))
+            with self._phase('load admincogs (total)'):
+                for admincog in _admincogs('admincogs'):
+                    self.load_extension(admincog.replace('/', '.').replace('\\', '.'))
         except ClientException:
             log.critical('Could not load administrative cogs!')
         except ImportError:
             log.critical('Administrative cogs could not be imported!')
             traceback.print_exc()
 
+    @contextmanager
+    def _phase(self, name):
+        if self.timeline:
+            with self.timeline.phase(name):
+                yield
+        else:
+            yield
+
+    def _load_from_module_spec(self, spec, key):
+        if self.timeline:
+            spec.loader = TimedLoader(spec.loader, self.timeline, key)
+        super()._load_from_module_spec(spec, key)
+
+    def _finish_timeline(self):
+        self.timeline.record('login to ready', self.runstart, perf_counter())
+        for line in self.timeline.report():
+            log.info(line)
+        if self.timeline_out:
+            self.timeline.dump(self.timeline_out)
+        self.timeline = None
+
     def register_nodes(self, nodes):
         for node in nodes:
             if node not in self.cfg['nodes']:
@@ -92,6 +147,19 @@ class Charfred(commands.Bot):
         if cfg not in self.cfg['cogcfgs']:
             self.cfg['cogcfgs'][cfg] = (defaultvalue, prompt)
 
+    def cached_is_owner(self, user):
+        """Checks ownership against the owner id(s) cached by is_owner,
+        without awaiting anything.
+
+        Returns None if the owner has not been fetched yet.
+        """
+
+        if self.owner_id:
+            return user.id == self.owner_id
+        elif self.owner_ids:
+            return user.id in self.owner_ids
+        return None
+
     async def get_context(self, message, *, cls=CharfredContext):
         return await super().get_context(message, cls=cls)
 
@@ -103,26 +171,45 @@ class Charfred(commands.Bot):
         log.info(f'ID: {self.user.id}')
         if not hasattr(self, 'uptime'):
             self.uptime = datetime.datetime.now()
+        await self.is_owner(self.user)  # Primes the owner id cache.
+        if self.timeline:
+            self._finish_timeline()
 
     async def on_message(self, message):
+        self.prompts.dispatch(message)
         if message.author.bot:
             return
+        if self.prefixes.match(message) is None:
+            self.msgs_rejected += 1
+            return
         if message.guild is None:
-            is_owner = await self.is_owner(message.author)
+            is_owner = self.cached_is_owner(message.author)
+            if is_owner is None:
+                is_owner = await self.is_owner(message.author)
             if not is_owner:
+                self.msgs_rejected += 1
                 return
+        self.msgs_dispatched += 1
         ctx = await self.get_context(message)
         await self.invoke(ctx)
 
     async def close(self):
         log.info('Shutting down, this may take a couple seconds...')
+        cfgs = list(Config.instances.values())
+        results = await asyncio.gather(*(cfg.flush() for cfg in cfgs), return_exceptions=True)
+        for cfg, result in zip(cfgs, results):
+            if isinstance(result, Exception):
+                log.error(f'Could not flush {cfg.cfgfile}: {result!r}')
+        log.info('Pending config writes flushed.')
+        self.fswatcher.close()
         await super().close()
         log.info('Client disconnected.')
+        self.outbound.close()
         await self.session.close()
         log.info('Session closed.')
         log.info('All done, goodbye sir!')
 
-    def run(self, token=None):
+    def run(self, token=None, timeline_out=None):
         if token is None:
             log.info('Using pre-configured Token...')
             try:
@@ -135,16 +222,26 @@ class Charfred(commands.Bot):
             self.cfg._save()
             log.info('Token saved for future use!')
 
+        self.timeline_out = timeline_out
+        self.runstart = perf_counter()
         super().run(token, reconnect=True)
 
 
 @click.command()
 @click.option('--loglvl', default="DEBUG", help='Logging Level')
 @click.option('--token', default=None, help='Discord Bot Token')
-def run(loglvl, token):
+@click.option('--profile-startup', is_flag=True,
+              help='Time every startup phase and report once ready')
+@click.option('--profile-output', default=None, type=click.Path(dir_okay=False),
+              help='Also write the startup timeline to this JSON file')
+def run(loglvl, token, profile_startup, profile_output):
     coloredlogs.install(level=loglvl,
                         logger=log,
                         fmt='%(asctime)s:%(msecs)03d [%(name)s]: %(levelname)s %(message)s')
     log.info('Initializing Charfred!')
-    char = Charfred()
-    char.run(token)
+    if profile_startup or profile_output:
+        timeline = StartupTimeline(origin=_started)
+    else:
+        timeline = None
+    char = Charfred(timeline=timeline)
+    char.run(token, timeline_out=profile_output)
@@ -0,0 +1,96 @@
+import time
+import pytest
+from utils.collections import TTLCache, SimpleTTLDict
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_default_clock_is_monotonic():
+    assert TTLCache().clock is time.monotonic
+
+
+def test_items_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache['a'] = 1
+
+    clock.now += 9.9
+    assert cache['a'] == 1
+    clock.now += 0.1
+    assert 'a' not in cache
+    with pytest.raises(KeyError):
+        cache['a']
+    assert len(cache) == 0
+    assert cache.stats == {'hits': 1, 'misses': 1, 'evictions': 0, 'expirations': 1}
+
+
+def test_least_recently_used_is_evicted():
+    cache = TTLCache(ttl=10, maxsize=2, clock=FakeClock())
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['a']
+    cache['c'] = 3
+
+    assert list(cache) == ['a', 'c']
+    assert cache.stats['evictions'] == 1
+
+
+def test_overwrite_restarts_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache['a'] = 1
+    clock.now += 5
+    cache['a'] = 2
+
+    # The deque entry of the first write comes up, and is skipped.
+    clock.now += 7
+    cache['b'] = 3
+    assert cache['a'] == 2
+    assert cache.expirations == 0
+
+    clock.now += 4
+    cache['c'] = 4
+    assert 'a' not in cache
+    assert cache.expirations == 1
+
+
+def test_overwrites_with_equal_deadlines_are_compacted():
+    # A clock that does not move, like a coarse one between ticks.
+    cache = TTLCache(ttl=10, clock=FakeClock())
+    for num in range(10000):
+        cache[num % 10] = num
+
+    assert len(cache.deadlines) <= 2 * len(cache.data) + 64
+    assert dict(cache) == {num: 9990 + num for num in range(10)}
+
+
+def test_simple_ttl_dict_returns_value_and_creation_date():
+    clock = FakeClock()
+    cache = SimpleTTLDict(ttl_seconds=60)
+    cache.clock = clock
+    cache['a'] = 'value'
+    clock.now += 30
+
+    value, date = cache['a']
+    assert value == 'value'
+    assert abs(date - (time.time() - 30)) <= 1
+    assert cache.getvalue('a') == 'value'
+
+
+def test_simple_ttl_dict_raises_for_expired_keys():
+    clock = FakeClock()
+    cache = SimpleTTLDict(ttl_seconds=60)
+    cache.clock = clock
+    cache['a'] = 'value'
+    clock.now += 60
+
+    with pytest.raises(KeyError):
+        cache['a']
+    with pytest.raises(KeyError):
+        cache.getvalue('a')
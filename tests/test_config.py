@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from utils.config import Config
+
+
+def _config(path, loop):
+    return Config(str(path), load=True, loop=loop, journal=True)
+
+
+def test_journal_replay_after_crash_before_truncate(tmp_path, monkeypatch):
+    async def crash():
+        loop = asyncio.get_running_loop()
+        cfg = _config(tmp_path / 'cfg.toml', loop)
+        cfg['a'] = 1
+        cfg['b'] = 1
+        await cfg.save()
+        await cfg.flush()
+        assert cfg.journalfile.stat().st_size > 0
+
+        # The snapshot is written, but the journal is never emptied.
+        monkeypatch.setattr(Config, '_truncate', lambda self, size=0: None)
+        cfg['a'] = 2
+        del cfg['b']
+        cfg._save()
+        monkeypatch.undo()
+
+        return dict(_config(tmp_path / 'cfg.toml', loop))
+
+    assert asyncio.run(crash()) == {'a': 2}
+
+
+@pytest.mark.parametrize('journal', [False, True])
+def test_reload_moves_shard_keys_into_their_shard(tmp_path, journal):
+    async def edit():
+        loop = asyncio.get_running_loop()
+        path = tmp_path / 'cfg.toml'
+        cfg = Config(str(path), load=True, loop=loop, journal=journal, shards=('prefix',))
+        cfg['a'] = 1
+        cfg['prefix'] = ['!']
+        cfg._save()
+        events = []
+        cfg.subscribe(lambda config, ops: events.append((config, ops)))
+
+        path.write_text(path.read_text() + 'prefix = [ "?",]\n')
+        await cfg.reload()
+
+        assert list(cfg) == ['a', 'prefix']
+        assert cfg['prefix'] == ['?']
+        assert events == [(cfg, [('set', ('prefix',), ['?'])])]
+        assert 'prefix' not in path.read_text()
+        # Nothing to pick up from our own write.
+        assert await cfg.reload() == []
+        return dict(Config(str(path), load=True, loop=loop, journal=journal, shards=('prefix',)))
+
+    assert asyncio.run(edit()) == {'a': 1, 'prefix': ['?']}
@@ -0,0 +1,23 @@
+import io
+import gzip
+import discord
+import pytest
+from utils.context import _payload
+
+TEXT = '\n'.join(f'line {num}' for num in range(50000))
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_payload_makes_a_discord_file(compress):
+    payload, size = _payload(TEXT, compress)
+    # discord.File opens anything that is not an io.IOBase as a path.
+    file = discord.File(payload, filename='output.txt')
+
+    assert isinstance(file.fp, io.IOBase)
+    data = file.fp.read()
+    assert len(data) == size
+    assert (gzip.decompress(data) if compress else data) == TEXT.encode()
+
+
+def test_payload_gzip_is_smaller():
+    assert _payload(TEXT, True)[1] < _payload(TEXT, False)[1]
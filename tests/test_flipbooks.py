@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace as NS
+from utils.flipbooks import LazyFlipbook
+
+AUTHOR = NS(id=1)
+
+
+class FakeMessage:
+    id = 1
+    channel = NS(id=2)
+
+    def __init__(self, shown):
+        self.shown = shown
+
+    async def edit(self, embed=None, **kwargs):
+        self.shown.append(embed.description)
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def remove_reaction(self, emoji, user):
+        pass
+
+    async def clear_reactions(self):
+        pass
+
+
+class FakeContext:
+    def __init__(self, loop):
+        self.bot = NS(loop=loop)
+        self.author = AUTHOR
+        self.shown = []
+
+    async def send(self, embed=None):
+        self.shown.append(embed.description)
+        return FakeMessage(self.shown)
+
+
+def _press(book, emoji):
+    return book.react(NS(emoji=emoji, message=book.msg), AUTHOR)
+
+
+def _flip_back_past_window(source):
+    async def flip():
+        ctx = FakeContext(asyncio.get_running_loop())
+        book = LazyFlipbook(ctx, source, entries_per_page=2, window=3)
+        await book.draw_page(0, first=True)
+        for _ in range(6):
+            assert await asyncio.wait_for(_press(book, '👉'), 1)
+        for _ in range(5):
+            assert await asyncio.wait_for(_press(book, '👈'), 1)
+        await asyncio.wait_for(book.expire(), 1)
+        return ctx.shown
+
+    return asyncio.run(flip())
+
+
+def test_lazy_flipbook_flips_back_past_window():
+    entries = [f'entry {num}' for num in range(20)]
+    shown = _flip_back_past_window(entries)
+    pages = [f'entry {2 * page}\nentry {2 * page + 1}' for page in range(7)]
+    assert shown == pages + pages[-2:0:-1]
+
+
+def test_lazy_flipbook_fetch_callback_past_window():
+    def fetch(page, per_page):
+        return [f'entry {num}' for num in range(page * per_page, min(20, (page + 1) * per_page))]
+
+    shown = _flip_back_past_window(fetch)
+    assert shown[-1] == 'entry 2\nentry 3'
+
+
+def test_lazy_flipbook_one_shot_iterator_past_window():
+    shown = _flip_back_past_window(f'entry {num}' for num in range(20))
+    assert shown[-1] == '> This page is no longer in memory!'
@@ -0,0 +1,40 @@
+import os
+import re
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous, since discord.py alone takes most of it; a regression to
+# eager imports of everything blows well past it.
+BUDGET_US = 1500000
+
+
+def _run(code, *flags):
+    return subprocess.run([sys.executable, *flags, '-c', code], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+
+
+def test_import_charfred_within_budget():
+    stderr = _run('import charfred', '-X', 'importtime').stderr
+    cumulative = int(re.search(r'\|\s*(\d+) \| charfred$', stderr, re.M).group(1))
+
+    assert cumulative < BUDGET_US
+
+
+def test_import_charfred_leaves_heavy_modules_unloaded():
+    code = (
+        'import sys, types, charfred\n'
+        "for name in ('psutil', 'humanize', 'asyncpg', 'toml'):\n"
+        '    module = sys.modules.get(name)\n'
+        '    if module is not None and type(module) is types.ModuleType:\n'
+        '        print(name)\n'
+    )
+
+    assert _run(code).stdout.split() == []
+
+
+def test_config_does_not_import_discord():
+    code = "import sys, utils; utils.Config; print('discord' in sys.modules)"
+
+    assert _run(code).stdout.strip() == 'False'
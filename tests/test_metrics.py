@@ -0,0 +1,63 @@
+import socket
+import asyncio
+from types import SimpleNamespace as NS
+from admincogs.metrics import Metrics
+
+
+class FakeCfg(dict):
+    async def save(self):
+        pass
+
+
+class FakeContext:
+    def __init__(self):
+        self.sent = []
+
+    async def sendmarkdown(self, msg):
+        self.sent.append(msg)
+
+
+def _setport(port):
+    """Runs the setport command; returns what it sent
+    and whether the endpoint is running afterwards.
+    """
+
+    async def setport():
+        cog = Metrics(NS(loop=asyncio.get_running_loop(), cfg=FakeCfg()))
+        ctx = FakeContext()
+        try:
+            await cog.setport.callback(cog, ctx, port)
+            return ctx.sent, cog.runner is not None
+        finally:
+            cog.lagsampler.cancel()
+            await cog._stop_endpoint()
+
+    return asyncio.run(setport())
+
+
+def test_setport_serves_metrics():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    sent, running = _setport(port)
+    assert sent == [f'# Serving metrics on 127.0.0.1:{port}/metrics!']
+    assert running
+
+
+def test_setport_reports_port_in_use():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        sock.listen()
+        port = sock.getsockname()[1]
+
+        sent, running = _setport(port)
+
+    assert sent[0].startswith(f'< Could not serve metrics on 127.0.0.1:{port}: ')
+    assert not running
+
+
+def test_setport_rejects_invalid_ports():
+    sent, running = _setport(70000)
+    assert sent == ['< Ports go from 1 to 65535! >']
+    assert not running
@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+from utils.outbound import OutboundScheduler
+
+
+def test_close_cancels_queued_and_in_flight_requests():
+    async def shutdown():
+        outbound = OutboundScheduler(asyncio.get_running_loop())
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        inflight = outbound.submit(1, 'send', hang)
+        queued = outbound.submit(1, 'send', hang)
+        await started.wait()
+        outbound.close()
+
+        for future in (inflight, queued):
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(future, 1)
+        await asyncio.sleep(0)
+        assert outbound.workers == {}
+        assert outbound.running == {}
+
+    asyncio.run(shutdown())
+
+
+def test_results_and_errors_are_passed_on():
+    async def requests():
+        outbound = OutboundScheduler(asyncio.get_running_loop())
+
+        async def ok():
+            return 'ok'
+
+        async def fail():
+            raise ValueError('nope')
+
+        results = await asyncio.gather(outbound.submit(1, 'send', ok),
+                                       outbound.submit(1, 'send', fail),
+                                       return_exceptions=True)
+        return results, outbound.running
+
+    results, running = asyncio.run(requests())
+    assert results[0] == 'ok'
+    assert isinstance(results[1], ValueError)
+    assert running == {}
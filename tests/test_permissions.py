@@ -0,0 +1,53 @@
+import random
+from types import SimpleNamespace as NS
+import discord
+from utils.permissions import NodeResolver
+
+
+def _old_allowed(cfg, guild, member, node):
+    """Permission check as it was before roles were indexed."""
+
+    roleName = cfg['nodes'].get(node)
+    if not roleName:
+        return False
+    if roleName == '@everyone':
+        return True
+    minRole = discord.utils.find(lambda r: r.name == roleName, guild.roles)
+    if minRole:
+        hierarchy = set(cfg['hierarchy'])
+        roles = [r for r in member.roles if r.name in hierarchy]
+        if roles:
+            return roles[-1] >= minRole
+    return False
+
+
+def _guild(rng):
+    guild = NS(id=1000)
+    roles = [discord.Role(guild=guild, state=None,
+                          data={'id': guild.id, 'name': '@everyone', 'position': 0})]
+    for num in range(rng.randint(1, 8)):
+        # Few positions and names, so ties and duplicate names are common.
+        roles.append(discord.Role(guild=guild, state=None, data={
+            'id': guild.id + rng.randint(1, 10 ** 6),
+            'name': f'role{rng.randint(0, 4)}',
+            'position': rng.randint(1, 3)
+        }))
+    guild.roles = sorted(roles)
+    return guild
+
+
+def test_resolver_matches_role_comparisons():
+    rng = random.Random(14)
+    for _ in range(500):
+        guild = _guild(rng)
+        names = sorted({role.name for role in guild.roles})
+        cfg = {
+            'hierarchy': rng.sample(names, rng.randint(0, len(names))),
+            'nodes': {f'node{num}': rng.choice(names + ['', 'missing']) for num in range(4)}
+        }
+        resolver = NodeResolver(NS(cfg=cfg))
+        for num in range(5):
+            roles = sorted(rng.sample(guild.roles, rng.randint(1, len(guild.roles))))
+            member = NS(id=num, guild=guild, roles=roles)
+            for node in cfg['nodes']:
+                assert resolver.allowed(member, node) == _old_allowed(cfg, guild, member, node)
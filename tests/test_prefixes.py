@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace as NS
+from utils.config import Config
+from utils.prefixes import PrefixIndex
+
+
+def _msg(guild_id, content):
+    return NS(guild=NS(id=guild_id) if guild_id else None, content=content)
+
+
+def _index(prefixes):
+    return PrefixIndex(NS(user=NS(id=42), cfg={'prefix': prefixes}))
+
+
+def test_match_uses_guild_prefixes_and_mentions():
+    index = _index({'1': ['!', '!!']})
+
+    assert index.match(_msg(1, '!help')) == '!'
+    assert index.match(_msg(1, '<@!42> help')) == '<@!42> '
+    assert index.match(_msg(2, '!help')) is None
+    assert index.match(_msg(None, '<@42> help')) == '<@42> '
+
+
+def test_guild_change_invalidates_only_that_guild():
+    index = _index({'1': ['!'], '2': ['$']})
+    index.match(_msg(1, '!help'))
+    index.match(_msg(2, '$help'))
+
+    index.bot.cfg['prefix']['1'] = ['?']
+    index.cfg_changed(index.bot.cfg, [('set', ('prefix', '1'), ['?'])])
+
+    assert set(index.matchers) == {2}
+    assert index.match(_msg(1, '?help')) == '?'
+    assert index.match(_msg(1, '!help')) is None
+
+
+def test_prefix_table_change_invalidates_all_guilds():
+    index = _index({'1': ['!'], '2': ['$']})
+    index.match(_msg(1, '!help'))
+    index.match(_msg(2, '$help'))
+
+    index.bot.cfg['prefix'] = {'2': ['%']}
+    index.cfg_changed(index.bot.cfg, [('set', ('prefix',), {'2': ['%']})])
+
+    assert index.matchers == {}
+    assert index.match(_msg(1, '!help')) is None
+    assert index.match(_msg(2, '%help')) == '%'
+
+
+def test_unrelated_change_keeps_matchers():
+    index = _index({'1': ['!']})
+    index.match(_msg(1, '!help'))
+
+    index.cfg_changed(index.bot.cfg, [('set', ('nodes', 'foo'), 'bar'), ('del', ('hierarchy',))])
+
+    assert set(index.matchers) == {1}
+
+
+def test_reloaded_prefixes_are_matched(tmp_path):
+    async def reload():
+        path = tmp_path / 'cfg.toml'
+        path.write_text('[prefix]\n1 = [ "!",]\n')
+        cfg = Config(str(path), load=True, loop=asyncio.get_running_loop())
+        index = PrefixIndex(NS(user=NS(id=42), cfg=cfg))
+        cfg.subscribe(index.cfg_changed)
+        before = index.match(_msg(1, '?help'))
+
+        path.write_text('[prefix]\n1 = [ "?",]\n')
+        await cfg.reload()
+        return before, index.match(_msg(1, '?help'))
+
+    assert asyncio.run(reload()) == (None, '?')
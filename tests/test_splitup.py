@@ -0,0 +1,135 @@
+import re
+import time
+import random
+import pytest
+from itertools import islice
+from utils.mixed import splitup, _fencing
+
+FENCES = ['```', '```py', '```markdown']
+
+
+def _text(rng):
+    lines = []
+    for _ in range(rng.randint(0, 60)):
+        roll = rng.random()
+        if roll < 0.15:
+            lines.append(rng.choice(FENCES))
+        elif roll < 0.2:
+            lines.append('')
+        else:
+            # Now and then a line too long for any chunk.
+            length = rng.choice([rng.randint(0, 40), rng.randint(0, 400)])
+            lines.append(''.join(rng.choice('ab c#<>') for _ in range(length)))
+    return '\n'.join(lines) + rng.choice(['', '\n'])
+
+
+def _content(text):
+    """Everything but whitespace and fence lines, which the splitter
+    is allowed to add, move and drop around chunk boundaries.
+    """
+
+    kept = [line for line in text.split('\n') if not line.strip().startswith('```')]
+    return re.sub(r'\s', '', ''.join(kept))
+
+
+def _closed(chunk):
+    fence = None
+    for line in chunk.split('\n'):
+        fence = _fencing(fence, line)
+    return fence is None
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_chunking_invariants(seed):
+    rng = random.Random(seed)
+    text = _text(rng)
+    limit = rng.randint(30, 300)
+    chunks = list(splitup(text, limit=limit))
+
+    assert all(len(chunk) <= limit for chunk in chunks)
+    assert all(chunk.strip() for chunk in chunks)
+    assert all(_closed(chunk) for chunk in chunks)
+    assert _content('\n'.join(chunks)) == _content(text)
+
+
+def _subsequence(needle, haystack):
+    chars = iter(haystack)
+    return all(char in chars for char in needle)
+
+
+def _odd_text(rng, limit):
+    """Fence lines longer than the limit, fences with trailing blanks
+    and lines full of backticks.
+    """
+
+    lines = []
+    for _ in range(rng.randint(1, 30)):
+        roll = rng.random()
+        if roll < 0.2:
+            lines.append('```' + 'q' * rng.randint(limit - 10, 3 * limit))
+        elif roll < 0.4:
+            lines.append(rng.choice(FENCES + ['``` ', ' ```py ', '````']))
+        else:
+            length = rng.randint(0, 3 * limit)
+            lines.append(''.join(rng.choice('ab `') for _ in range(length)))
+    return '\n'.join(lines)
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_chunking_invariants_with_odd_fences(seed):
+    rng = random.Random(seed)
+    limit = rng.randint(20, 300)
+    text = _odd_text(rng, limit)
+    # Every chunk holds at least a character, so anything longer
+    # than this means the splitter got stuck.
+    chunks = list(islice(splitup(text, limit=limit), len(text) + 1))
+
+    assert len(chunks) <= len(text)
+    assert all(len(chunk) <= limit for chunk in chunks)
+    assert all(chunk.strip() for chunk in chunks)
+    assert all(_closed(chunk) for chunk in chunks)
+    # Wrapped pieces are fenced like lines, so backticks may go and
+    # blocks be reopened; everything else has to be there, in order.
+    assert _subsequence(_content(text).replace('`', ''),
+                        re.sub(r'[\s`]', '', ''.join(chunks)))
+
+
+def test_fence_longer_than_limit():
+    chunks = list(islice(splitup('```' + 'x' * 30 + '\nabc\n```', limit=20), 10))
+
+    assert len(chunks) < 10
+    assert all(len(chunk) <= 20 and _closed(chunk) for chunk in chunks)
+
+    text = '```' + 'q' * 1990 + '\nhello\n```'
+    chunks = list(islice(splitup(text), 10))
+    assert sum(len(chunk) for chunk in chunks) < len(text) + 20
+
+
+def test_continued_codeblock_is_reopened_with_its_fence():
+    text = '```py\n' + '\n'.join(f'line {num}' for num in range(50)) + '\n```'
+    chunks = list(splitup(text, limit=100))
+
+    assert len(chunks) > 1
+    assert all(chunk.startswith('```py\n') and chunk.endswith('\n```') for chunk in chunks)
+
+
+def test_last_chunk_is_kept():
+    text = '\n'.join(f'line {num}' for num in range(30))
+    chunks = list(splitup(text, limit=50))
+
+    assert chunks[-1].endswith('line 29')
+
+
+def test_long_line_is_hard_wrapped():
+    chunks = list(splitup('x' * 5000))
+
+    assert [len(chunk) for chunk in chunks] == [2000, 2000, 1000]
+
+
+def test_first_chunk_comes_before_the_rest_is_split():
+    text = '```\n' + 'y' * 100 + '\n' + 'z' * 10 ** 7 + '\n```'
+    started = time.perf_counter()
+    first = next(splitup(text))
+
+    assert first == '```\n' + 'y' * 100 + '\n```'
+    assert time.perf_counter() - started < 0.5
@@ -1,6 +1,7 @@
 import logging
 from asyncio import wait_for, TimeoutError
 from discord.ext import commands
+from utils import lazy_import, LazyFlipbook
 
 log = logging.getLogger(f'charfred.{__name__}')
 
@@ -81,13 +82,14 @@ class DBOperator(commands.Cog):
         A variable number of arguments can be given via $n notation.
         """
 
-        async with self.db.acquire() as con:
-            if args:
-                stat = await con.execute(command, *args)
-            else:
-                stat = await con.execute(command)
-        log.info(stat)
-        await ctx.sendmarkdown(stat)
+        async with ctx.progress('Executing...') as progress:
+            async with self.db.acquire() as con:
+                if args:
+                    stat = await con.execute(command, *args)
+                else:
+                    stat = await con.execute(command)
+            log.info(stat)
+            progress.finish(stat)
 
     @database.command(hidden=True)
     @commands.is_owner()
@@ -99,14 +101,15 @@ class DBOperator(commands.Cog):
         subcommand.
         """
 
-        async with self.db.acquire() as con:
-            if args:
-                rec = await con.fetch(query, args)
-            else:
-                rec = await con.fetch(query)
-        self.queryresult = rec
-        log.info(f'# Query cached with {len(rec)} rows!')
-        await ctx.sendmarkdown(f'# Query cached with {len(rec)} rows!')
+        async with ctx.progress('Querying...') as progress:
+            async with self.db.acquire() as con:
+                if args:
+                    rec = await con.fetch(query, args)
+                else:
+                    rec = await con.fetch(query)
+            self.queryresult = rec
+            log.info(f'# Query cached with {len(rec)} rows!')
+            progress.finish(f'# Query cached with {len(rec)} rows!')
 
     @database.group(invoke_without_command=False, hidden=True)
     @commands.is_owner()
@@ -116,10 +119,24 @@ class DBOperator(commands.Cog):
     @record.command(hidden=True)
     @commands.is_owner()
     async def read(self, ctx):
-        """TODO
+        """Flip through the cached Record list of the last query.
+
+        Records are only formatted as their pages are flipped to.
         """
 
-        pass
+        rec = self.queryresult
+        if not rec:
+            await ctx.sendmarkdown('> No query result cached!')
+            return
+
+        def fetch(page, per_page):
+            start = page * per_page
+            return [f'{num}: ' + ', '.join(f'{k}={v}' for k, v in r.items())
+                    for num, r in enumerate(rec[start:start + per_page], start)]
+
+        recordbook = LazyFlipbook(ctx, fetch, entries_per_page=10,
+                                  title=f'Cached Records ({len(rec)} rows)')
+        await recordbook.flip()
 
     @database.group(invoke_without_command=True, hidden=True)
     @commands.is_owner()
@@ -158,7 +175,7 @@ class DBOperator(commands.Cog):
 
 
 try:
-    import asyncpg
+    asyncpg = lazy_import('asyncpg')
 except ImportError:
     log.error('Could not import asyncpg, dboperator not loaded!')
 
@@ -14,25 +14,35 @@ class GitOperator(commands.Cog):
         self.cfg = bot.cfg
 
     async def _gitcmd(self, ctx, path, cmd):
-        proc = await asyncio.create_subprocess_exec(
-            'git',
-            '-C',
-            f'{path}',
-            cmd,
-            loop=self.loop,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await proc.communicate()
-        if proc.returncode == 0:
-            log.info(f'"git {cmd}" executed.')
-        else:
-            log.warning(f'"git {cmd}" failed!')
-            await ctx.sendmarkdown('< Command failed, exited with error! >')
-            return
-        output = stdout.decode().strip()
-        log.info(output)
-        await ctx.sendmarkdown(f'# Command output:\n{output}')
+        async with ctx.progress(f'Running git {cmd}...') as progress:
+            proc = await asyncio.create_subprocess_exec(
+                'git',
+                '-C',
+                f'{path}',
+                cmd,
+                loop=self.loop,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            # Output is streamed into the progress message as it comes in,
+            # stderr is drained alongside so git never blocks on it.
+            stderr = self.loop.create_task(proc.stderr.read())
+            lines = []
+            async for line in proc.stdout:
+                line = line.decode()
+                lines.append(line)
+                progress.update(output=line)
+            await stderr
+            await proc.wait()
+            if proc.returncode == 0:
+                log.info(f'"git {cmd}" executed.')
+            else:
+                log.warning(f'"git {cmd}" failed!')
+                progress.finish('< Command failed, exited with error! >')
+                return
+            output = ''.join(lines).strip()
+            log.info(output)
+            progress.finish(f'# Command output:\n{output}')
 
     async def _validate(self, repo, ctx=None):
         if not repo.exists():
@@ -1,9 +1,10 @@
 import logging
-import psutil
 from datetime import datetime as dt
-from humanize import naturalsize
 from discord.ext import commands
-from utils import permission_node
+from utils import permission_node, lazy_import
+
+psutil = lazy_import('psutil')
+humanize = lazy_import('humanize')
 
 log = logging.getLogger(f'charfred.{__name__}')
 
@@ -74,10 +75,10 @@ def format_info(process, procinfo):
         '',
         f'# CPU Utilization: {procinfo["cpu_percent"]} % (highest value over 5 seconds)',
         f'# Number of Threads: {procinfo["num_threads"]}',
-        f'# Memory usage: {naturalsize(memory.rss)}',
-        f'# Virtual Memory Size: {naturalsize(memory.vms)}',
-        f'# Unique Set Size: {naturalsize(memory.uss)}',
-        f'# Swap: {naturalsize(memory.swap)}'
+        f'# Memory usage: {humanize.naturalsize(memory.rss)}',
+        f'# Virtual Memory Size: {humanize.naturalsize(memory.vms)}',
+        f'# Unique Set Size: {humanize.naturalsize(memory.uss)}',
+        f'# Swap: {humanize.naturalsize(memory.swap)}'
     ]
     msg = '\n'.join(msg)
     return msg
@@ -146,11 +147,9 @@ class Quartermaster(commands.Cog):
         else:
             process = process[0]
 
-        tmpmsg = await ctx.sendmarkdown('> Profiling...')
-        procinfo = await self.loop.run_in_executor(None, getProcInfo, process)
-        msg = format_info(process, procinfo)
-        await tmpmsg.delete()
-        await ctx.sendmarkdown(msg)
+        async with ctx.progress('Profiling...') as progress:
+            procinfo = await self.loop.run_in_executor(None, getProcInfo, process)
+            progress.finish(format_info(process, procinfo))
 
     @qm.command(aliases=['chartop'])
     async def charprofile(self, ctx):
@@ -166,11 +165,9 @@ class Quartermaster(commands.Cog):
             await ctx.sendmarkdown('< psutil failed with "access denied"! >')
         else:
 
-            tmpmsg = await ctx.sendmarkdown('> Profiling...')
-            procinfo = await self.loop.run_in_executor(None, getProcInfo, process)
-            msg = format_info(process, procinfo)
-            await tmpmsg.delete()
-            await ctx.sendmarkdown(msg)
+            async with ctx.progress('Profiling...') as progress:
+                procinfo = await self.loop.run_in_executor(None, getProcInfo, process)
+                progress.finish(format_info(process, procinfo))
 
     @qm.command(aliases=['du'])
     async def diskusage(self, ctx):
@@ -195,8 +192,9 @@ class Quartermaster(commands.Cog):
                 prefix = '  '
                 suffix = ''
             msg.append(
-                f'{prefix}{dev.device:10} {naturalsize(use.total):>8} {naturalsize(use.used):>8}'
-                f' {naturalsize(use.free):>8} {int(use.percent):>4}% {dev.mountpoint}{suffix}'
+                f'{prefix}{dev.device:10} {humanize.naturalsize(use.total):>8}'
+                f' {humanize.naturalsize(use.used):>8} {humanize.naturalsize(use.free):>8}'
+                f' {int(use.percent):>4}% {dev.mountpoint}{suffix}'
             )
         await ctx.sendmarkdown('\n'.join(msg))
 
@@ -221,11 +219,11 @@ class Quartermaster(commands.Cog):
         msg = [
             '# Memory Usage:',
             '>     Total   Avail.      %',
-            f'{prefix} {naturalsize(mem.total):>8} {naturalsize(mem.available):>8}'
-            f' {mem.percent:>5}%{suffix}',
+            f'{prefix} {humanize.naturalsize(mem.total):>8}'
+            f' {humanize.naturalsize(mem.available):>8} {mem.percent:>5}%{suffix}',
             '\n# Swap:',
             '>    Total     Used      %',
-            f'{prefixs}{naturalsize(swp.total):>8} {naturalsize(swp.used):>8} '
+            f'{prefixs}{humanize.naturalsize(swp.total):>8} {humanize.naturalsize(swp.used):>8} '
             f'{swp.percent:>5}%{suffixs}'
         ]
         await ctx.sendmarkdown('\n'.join(msg))
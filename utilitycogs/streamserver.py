@@ -14,6 +14,8 @@ class StreamServer(commands.Cog):
         self.server = None
         self.cfg = bot.cfg
         self.handlers = {}
+        self.accepted = 0
+        self.handed_off = 0
         self.loop.create_task(self._start_server())
 
     @property
@@ -76,6 +78,7 @@ class StreamServer(commands.Cog):
         the connection is closed, outside of the server itself closing.
         """
 
+        self.accepted += 1
         peer = str(writer.get_extra_info('peername'))
         log.info(f'New connection established with {peer}.')
 
@@ -110,6 +113,7 @@ class StreamServer(commands.Cog):
                 return
 
             if handler in self.handlers:
+                self.handed_off += 1
                 self.loop.create_task(self.handlers[handler](reader, writer, handshake))
             else:
                 log.warning(f'Handler "{handler}" specified by {peer} is unknown,'
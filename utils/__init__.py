@@ -1,9 +1,45 @@
-from .config import Config
-from .permissions import permission_node, node_check
-from .mixed import cached_property, splitup
-from .context import CharfredContext
-from .flipbooks import Flipbook, EmbedFlipbook
-from .collections import SimpleTTLDict, SizedDict
+from importlib import import_module
+from .lazy import lazy_import
+
+# Exported names and the submodules they live in; submodules are only
+# imported once one of their names is first accessed.
+_exports = {
+    'Config': 'config',
+    'permission_node': 'permissions',
+    'node_check': 'permissions',
+    'NodeResolver': 'permissions',
+    'cached_property': 'mixed',
+    'splitup': 'mixed',
+    'CharfredContext': 'context',
+    'Flipbook': 'flipbooks',
+    'EmbedFlipbook': 'flipbooks',
+    'LazyFlipbook': 'flipbooks',
+    'TTLCache': 'collections',
+    'SimpleTTLDict': 'collections',
+    'SizedDict': 'collections',
+    'PrefixIndex': 'prefixes',
+    'PromptRouter': 'prompts',
+    'MetricsRegistry': 'metrics',
+    'Histogram': 'metrics',
+    'format_latency': 'metrics',
+    'LoopWatchdog': 'watchdog',
+    'make_watcher': 'fswatch'
+}
+
+
+def __getattr__(name):
+    try:
+        submodule = _exports[name]
+    except KeyError:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}') from None
+    value = getattr(import_module(f'.{submodule}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_exports))
+
 
 # Colors from http://colourlovers.com;
 # names correspond to the color names on the site.
@@ -1,53 +1,143 @@
 import time
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
 
 
-class SimpleTTLDict(OrderedDict):
-    """Super simple implementation of an OrderedDict with expiring
-    items.
+class TTLCache(MutableMapping):
+    """Mapping with expiring items, and optionally a maximum size.
 
-    Only deletes items that have outlived their ttl when new items
-    are inserted.
+    Items expire ttl seconds after they were last set, by the monotonic
+    clock; expired items are treated as missing on reads, and purged on
+    writes, oldest first, from a deque of deadlines. Since every item
+    lives equally long, deadlines are appended in order; the deque entries
+    of updated or deleted items are skipped once they come up, told apart
+    by identity, since deadlines alone can be equal on a coarse clock.
+
+    With a maximum size, the least recently used item is evicted to make
+    room. Hits, misses, evictions and expirations are counted.
     """
-    def __init__(self, ttl_seconds=360):
-        assert ttl_seconds >= 0
 
-        super().__init__(self)
-        self.ttl = ttl_seconds
-
-    def _expire(self):
-        """Deletes all dict items that have outlived their ttl."""
-        now = int(time.time())
-        while self:
-            (key, (value, date)) = super().popitem(last=False)
-            if now - date > self.ttl:
-                continue
-            else:
-                super().__setitem__(key, (value, date))
-                super().move_to_end(key, last=False)
-                break
+    def __init__(self, ttl=360, maxsize=None, clock=time.monotonic):
+        assert ttl >= 0
+        assert maxsize is None or maxsize >= 1
+
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.data = OrderedDict()
+        self.deadlines = deque()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'expirations': self.expirations}
+
+    def _expire(self, now):
+        """Deletes all items that have outlived their ttl."""
+        deadlines = self.deadlines
+        data = self.data
+        while deadlines and deadlines[0][0] <= now:
+            (_, key, entry) = deadlines.popleft()
+            if data.get(key) is entry:
+                del data[key]
+                self.expirations += 1
+        # Skipped entries pile up if items are updated a lot.
+        if len(deadlines) > 2 * len(data) + 64:
+            self.deadlines = deque(item for item in deadlines if data.get(item[1]) is item[2])
+
+    def _lookup(self, key):
+        """Returns the (value, deadline) entry of a live item,
+        counting hits and misses.
+        """
+        try:
+            entry = self.data[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        if entry[1] <= self.clock():
+            del self.data[key]
+            self.expirations += 1
+            self.misses += 1
+            raise KeyError(key)
+        self.hits += 1
+        if self.maxsize is not None:
+            self.data.move_to_end(key)
+        return entry
+
+    def __getitem__(self, key):
+        return self._lookup(key)[0]
 
     def __setitem__(self, key, value):
-        """Set d[key] to (value, date), where date is its creation time.
+        """Sets the item, (re)starting its ttl.
 
-        Also removes all expired entries.
+        Also removes all expired items and,
+        if over maximum size, the least recently used ones.
         """
-        self._expire()
-        super().__setitem__(key, (value, int(time.time())))
-        super().move_to_end(key)
+        now = self.clock()
+        self._expire(now)
+        deadline = now + self.ttl
+        entry = (value, deadline)
+        self.data[key] = entry
+        self.data.move_to_end(key)
+        self.deadlines.append((deadline, key, entry))
+        if self.maxsize is not None:
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __contains__(self, key):
+        entry = self.data.get(key)
+        return entry is not None and entry[1] > self.clock()
+
+    def __len__(self):
+        self._expire(self.clock())
+        return len(self.data)
+
+    def __iter__(self):
+        now = self.clock()
+        self._expire(now)
+        return iter([key for key, (_, deadline) in self.data.items() if deadline > now])
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self.items())!r})'
+
+    def clear(self):
+        self.data.clear()
+        self.deadlines.clear()
 
     def getvalue(self, key):
-        """Gets the value from a (value, date) tuple of a given key."""
-        return super().__getitem__(key)[0]
+        """Gets the value of a given key."""
+        return self._lookup(key)[0]
 
     def find(self, predicate):
         """Finds and returns the first value that satisifies a given
-        predicate."""
-        for (value, _) in reversed(self.values()):
-            if predicate(value):
+        predicate, most recently set (or used, with a maximum size) first."""
+        now = self.clock()
+        for (value, deadline) in reversed(self.data.values()):
+            if deadline > now and predicate(value):
                 return value
 
 
+class SimpleTTLDict(TTLCache):
+    """TTLCache, with SimpleTTLDict's interface; getting an item
+    returns a (value, date) tuple, date being its creation time.
+    """
+    def __init__(self, ttl_seconds=360):
+        super().__init__(ttl_seconds)
+
+    def __getitem__(self, key):
+        (value, deadline) = self._lookup(key)
+        age = self.clock() - (deadline - self.ttl)
+        return (value, int(time.time() - age))
+
+
 class SizedDict(OrderedDict):
     """Super simple implementation of an OrderedDict with a fixed size.
 
@@ -1,32 +1,153 @@
+import os
+import io
+import marshal
+import hashlib
+import inspect
 import asyncio
 import logging
+import weakref
 import json
-import toml
+from zlib import crc32
 from pathlib import Path
+from contextlib import AsyncExitStack
 from collections.abc import MutableMapping
+from .lazy import lazy_import
+from .tracked import track, freeze
+
+toml = lazy_import('toml')
 
 log = logging.getLogger(f'charfred.{__name__}')
 
 
+def _diff(old, new, path=()):
+    """Yields the ops turning one nested dict into another;
+    ('set', path, value) or ('del', path), recursing into nested dicts.
+    """
+
+    for key, value in new.items():
+        try:
+            oldvalue = old[key]
+        except KeyError:
+            yield ('set', path + (key,), value)
+            continue
+        if oldvalue is value or (type(oldvalue) is type(value) and oldvalue == value):
+            continue
+        if isinstance(oldvalue, dict) and isinstance(value, dict):
+            yield from _diff(oldvalue, value, path + (key,))
+        else:
+            yield ('set', path + (key,), value)
+    for key in old:
+        if key not in new:
+            yield ('del', path + (key,))
+
+
+def _apply(store, op):
+    """Applies a single op, as yielded by _diff, to a nested dict."""
+
+    path = op[1]
+    target = store
+    for key in path[:-1]:
+        if not isinstance(target.get(key), dict):
+            target[key] = {}
+        target = target[key]
+    if op[0] == 'set':
+        target[path[-1]] = op[2]
+    else:
+        target.pop(path[-1], None)
+
+
 class Config(MutableMapping):
     """Config MutableMapping for dynamic configuration options;
     Parses data to and from json or toml files.
+
+    Saving is write-behind: save() only marks the config as dirty,
+    all saves within save_delay seconds are merged into a single write,
+    and saves arriving while a write is running are merged into one
+    follow-up write. flush() writes pending changes right away.
+
+    In journal mode only the changes since the last write are appended
+    to a journal file next to the config file, which is replayed on load
+    and compacted into a full snapshot once it exceeds journal_limit bytes.
+    Every journal record carries a checksum, so a torn record at the end
+    of the journal, left by a crash, is discarded on load.
+
+    Nested dicts and lists in the store are tracked copy-on-write;
+    writes serialise an immutable snapshot, which shares all unchanged
+    parts with the previous one, instead of the live store, so the loop
+    can keep mutating the config while a write is running.
+
+    Parsed configs are cached in marshal format next to the config file,
+    keyed by the file's mtime, size and hash; the text file remains the
+    source of truth, the cache is only used while it still matches it.
+    Since writing toml is lossy, the cache is only ever filled from
+    parsing, never from what was written.
+
+    Given a file watcher, changes to the config file are picked up
+    automatically; see reload().
+
+    Keys given as shards are kept in sub-configs, each with its own file
+    in a directory next to the config file, and its own lock, so they are
+    saved independently of each other and of the rest of the config;
+    values of shard keys still present in the config file are migrated
+    into their shard on load.
     """
 
+    instances = weakref.WeakValueDictionary()
+
     def __init__(self, cfgfile, **opts):
         self.cfgfile = Path(cfgfile)
         self.loop = opts.pop('loop', None)
         self.lock = asyncio.Lock()
+        self.save_delay = opts.pop('save_delay', 1.0)
+        self.dirty = False
+        self.writer = None
+        self.flushing = asyncio.Event()
         self.default = opts.pop('default', None)
+        self.journal = opts.pop('journal', False)
+        self.journal_limit = opts.pop('journal_limit', 65536)
+        self.journalfile = self.cfgfile.with_name(self.cfgfile.name + '.journal')
+        self.cachefile = self.cfgfile.with_name(self.cfgfile.name + '.cache')
+        self.debounce = opts.pop('debounce', 0.5)
+        self.watcher = opts.pop('watcher', None)
+        self.reloader = None
+        self.subscribers = []
+        self.ondisk = None
+        self.shards = {}
+        self._store = track({})
+        self.version = 0
+        self.latest = None
+        self.persisted = None
         self.toml = True if self.cfgfile.suffix == '.toml' else False
         if self.toml:
             self.loadfunc = toml.load
-            self.dumpfunc = toml.dump
+            self.dumpsfunc = toml.dumps
         else:
             self.loadfunc = json.load
-            self.dumpfunc = json.dump
+            self.dumpsfunc = json.dumps
+        shardkeys = opts.pop('shards', ())
+        if shardkeys:
+            sharddir = self.cfgfile.with_name(self.cfgfile.stem + '.d')
+            sharddir.mkdir(parents=True, exist_ok=True)
+            for key in shardkeys:
+                shard = Config(sharddir / f'{key}{self.cfgfile.suffix}', loop=self.loop,
+                               save_delay=self.save_delay, debounce=self.debounce,
+                               journal=self.journal, journal_limit=self.journal_limit,
+                               watcher=self.watcher)
+                shard.subscribe(self._relay)
+                self.shards[key] = shard
         if opts.pop('load', False):
             self._load()
+        Config.instances[id(self)] = self
+        if self.watcher is not None:
+            self.watch(self.watcher)
+
+    def watch(self, watcher):
+        self.watcher = watcher
+        try:
+            watcher.watch(self.cfgfile, self._changed)
+        except OSError:
+            log.warning(f'Could not watch {self.cfgfile}, changes to it '
+                        'will not be picked up automatically!')
 
     def _convert(self):
         if self.toml:
@@ -44,8 +165,11 @@ class Config(MutableMapping):
             loadfile = self.cfgfile
             loadfunc = self.loadfunc
         try:
-            with open(loadfile, 'r') as cf:
-                self.store = loadfunc(cf)
+            if loadfile == self.cfgfile:
+                self.store = self._read()
+            else:
+                with open(loadfile, 'r') as cf:
+                    self.store = loadfunc(cf)
             log.info(f'{loadfile} loaded.')
         except FileNotFoundError:
             log.warning(f'{loadfile} does not exist.')
@@ -63,10 +187,34 @@ class Config(MutableMapping):
             log.critical(f'Could not load {loadfile}!')
             self.store = {}
             log.info('Loaded as empty dict!')
+        if self.journal:
+            self._replay()
+        self.persisted = self.snapshot()
         if convertee.exists():
             self._save()
             convertee.unlink()
             log.info(f'Deleted {convertee}.')
+        if self.shards:
+            self._load_shards()
+
+    def _load_shards(self):
+        migrated = []
+        for key, shard in self.shards.items():
+            shard._load()
+            if key not in self.store:
+                continue
+            if key in shard.store:
+                log.warning(f'{key} exists in both {self.cfgfile} and {shard.cfgfile}; '
+                            f'keeping {shard.cfgfile}.')
+            else:
+                shard[key] = self.store[key]
+                shard._save()
+                log.info(f'Migrated {key} from {self.cfgfile} to {shard.cfgfile}.')
+            del self.store[key]
+            migrated.append(key)
+        # Shards are written first, so a crash in between loses nothing.
+        if migrated:
+            self._save()
 
     def _loadDefault(self):
         try:
@@ -78,34 +226,408 @@ class Config(MutableMapping):
             self.store = {}
             log.info('Loaded as empty dict!')
 
-    def _save(self, savee=None):
-        if savee is None:
-            savee = self.store
+    def _cachekey(self, raw, stat=None):
+        if stat is None:
+            stat = self.cfgfile.stat()
+        return (stat.st_mtime_ns, stat.st_size, hashlib.blake2b(raw, digest_size=16).digest())
+
+    def _read(self):
+        """Reads the config file, from the binary cache if it is still
+        valid, or by parsing the text and refreshing the cache if not.
+        """
+
+        raw = self.cfgfile.read_bytes()
+        key = self._cachekey(raw)
+        data = self._parse(raw, key)
+        self.ondisk = (key, raw)
+        return data
+
+    def _parse(self, raw, key=None):
+        """Parses raw config text, going through the cache if given
+        the key of the text.
+        """
+
+        if key is None:
+            return self.loadfunc(io.StringIO(raw.decode()))
+        try:
+            with open(self.cachefile, 'rb') as cf:
+                cachedkey, data = marshal.load(cf)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        else:
+            if cachedkey == key:
+                log.debug(f'{self.cfgfile} loaded from cache.')
+                return data
+        data = self.loadfunc(io.StringIO(raw.decode()))
+        self._cache(key, data)
+        return data
+
+    def _cache(self, key, data):
+        try:
+            dump = marshal.dumps((key, data))
+        except ValueError:
+            log.debug(f'{self.cfgfile} holds values marshal cannot handle, not caching.')
+            return
+        tmpfile = self.cachefile.with_suffix('.cachetmp')
+        try:
+            tmpfile.write_bytes(dump)
+            tmpfile.replace(self.cachefile)
+        except OSError:
+            log.warning(f'Could not write cache for {self.cfgfile}.')
+
+    def _write(self, savee, sync=False):
         self.cfgfile.parent.mkdir(parents=True, exist_ok=True)
         tmpfile = self.cfgfile.with_suffix('.tmp')
-        with open(tmpfile, 'w') as tmp:
-            self.dumpfunc(savee.copy(), tmp)
+        raw = self.dumpsfunc(savee).encode()
+        with open(tmpfile, 'wb') as tmp:
+            tmp.write(raw)
+            tmp.flush()
+            if sync:
+                os.fsync(tmp.fileno())
+            stat = os.fstat(tmp.fileno())
         tmpfile.replace(self.cfgfile)
+        # Remembered, so the watcher can tell our own writes from edits.
+        self.ondisk = (self._cachekey(raw, stat), raw)
+
+    @property
+    def store(self):
+        return self._store
+
+    @store.setter
+    def store(self, value):
+        self._store = track(value)
+
+    def snapshot(self):
+        """Returns an immutable snapshot of the store.
+
+        Only the containers changed since the previous snapshot are copied,
+        the rest is shared with it; snapshots must never be mutated.
+        """
+
+        frozen = freeze(self._store)
+        if frozen is not self.latest:
+            self.latest = frozen
+            self.version += 1
+        return frozen
+
+    def _save(self, savee=None):
+        if savee is not None:
+            self._write(savee)
+            return
+        for shard in self.shards.values():
+            shard._save()
+        savee = self.snapshot()
+        if savee is self.persisted and self.cfgfile.exists():
+            return
+        if self.journal:
+            self._log(self.persisted, savee)
+        self._write(savee, sync=self.journal)
+        self.persisted = savee
+        if self.journal:
+            self._truncate()
+
+    def _truncate(self, size=0):
+        try:
+            with open(self.journalfile, 'r+b') as jf:
+                jf.truncate(size)
+        except FileNotFoundError:
+            pass
+
+    def _replay(self):
+        """Applies all intact journal records to the store,
+        and cuts off a torn record at the end, if there is one.
+        """
+
+        try:
+            with open(self.journalfile, 'rb') as jf:
+                journal = jf.read()
+        except FileNotFoundError:
+            return
+
+        applied = 0
+        good = 0
+        for line in journal.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break
+            checksum, _, payload = line.rstrip(b'\n').partition(b' ')
+            try:
+                if int(checksum, 16) != crc32(payload):
+                    break
+                ops = json.loads(payload)
+            except ValueError:
+                break
+            for op in ops:
+                _apply(self.store, op)
+            applied += 1
+            good += len(line)
+        if good < len(journal):
+            log.warning(f'Discarding torn record at the end of {self.journalfile}.')
+            self._truncate(good)
+        if applied:
+            log.info(f'Replayed {applied} records from {self.journalfile}.')
+
+    def _append(self, record):
+        self.journalfile.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.journalfile, 'ab') as jf:
+            jf.write(record)
+            jf.flush()
+            os.fsync(jf.fileno())
+            return jf.tell()
+
+    def _log(self, old, new):
+        """Appends the changes from one snapshot to another as a journal
+        record; returns the journal's size, or None if nothing changed.
+
+        Changes are always journaled before a snapshot holding them is
+        written, so replaying the journal after a crash in between ends
+        up at that snapshot, instead of undoing it.
+        """
+
+        # Unchanged parts of both snapshots are the very same objects,
+        # so diffing them only walks the paths that changed.
+        ops = list(_diff(old or {}, new))
+        if not ops:
+            return None
+        payload = json.dumps(ops, separators=(',', ':')).encode()
+        return self._append(b'%08x %s\n' % (crc32(payload), payload))
+
+    def _compact(self):
+        """Writes the persisted state as a full snapshot and empties the journal."""
+
+        self._write(self.persisted, sync=True)
+        self._truncate()
+        log.info(f'Compacted {self.journalfile} into {self.cfgfile}.')
+
+    async def _persist(self):
+        """Writes the current state; as a full snapshot, or in journal mode,
+        as a record of the changes since the last write.
+
+        Has to be called with the lock held.
+        """
+
+        snapshot = self.snapshot()
+        if snapshot is self.persisted:
+            return
+
+        if not self.journal:
+            await self.loop.run_in_executor(None, self._write, snapshot)
+            self.persisted = snapshot
+            return
+
+        size = await self.loop.run_in_executor(None, self._log, self.persisted, snapshot)
+        self.persisted = snapshot
+        if size is not None and size > self.journal_limit:
+            await self.loop.run_in_executor(None, self._compact)
 
     async def save(self):
-        with await self.lock:
-            await self.loop.run_in_executor(None, self._save)
+        """Marks the config as dirty and schedules a write,
+        unless one is pending already.
+        """
+
+        self.dirty = True
+        if self.writer is None or self.writer.done():
+            self.writer = self.loop.create_task(self._write_behind())
+        # Only shards that actually changed get written.
+        for shard in self.shards.values():
+            await shard.save()
+
+    async def _write_behind(self):
+        try:
+            await asyncio.wait_for(self.flushing.wait(), self.save_delay)
+        except asyncio.TimeoutError:
+            pass
+        try:
+            while self.dirty:
+                self.dirty = False
+                async with self.lock:
+                    await self._persist()
+        except Exception:
+            self.dirty = True
+            log.exception(f'Could not write {self.cfgfile}!')
+        finally:
+            self.flushing.clear()
+
+    async def flush(self):
+        """Writes pending changes now, instead of waiting for
+        the write-behind window to pass.
+        """
+
+        if self.writer is not None and not self.writer.done():
+            self.flushing.set()
+            await self.writer
+        # Also retries once if the write-behind failed.
+        if self.dirty:
+            self.dirty = False
+            try:
+                async with self.lock:
+                    await self._persist()
+            except Exception:
+                self.dirty = True
+                raise
+        for shard in self.shards.values():
+            await shard.flush()
 
     async def load(self):
-        with await self.lock:
+        async with AsyncExitStack() as locks:
+            await locks.enter_async_context(self.lock)
+            for shard in self.shards.values():
+                await locks.enter_async_context(shard.lock)
             await self.loop.run_in_executor(None, self._load)
 
+    def subscribe(self, callback):
+        """Registers a callback to be called with the config and the list
+        of ops applied, whenever changes to the file were reloaded.
+
+        Callbacks may be coroutine functions.
+        """
+
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        try:
+            self.subscribers.remove(callback)
+        except ValueError:
+            pass
+
+    def _changed(self, path):
+        if self.reloader is not None:
+            self.reloader.cancel()
+        self.reloader = self.loop.call_later(self.debounce, self._reload_soon)
+
+    def _reload_soon(self):
+        self.reloader = None
+        self.loop.create_task(self._reload())
+
+    def _reread(self):
+        """Reads the config file and returns the ops turning what was
+        on disk before into what is on disk now.
+        """
+
+        try:
+            raw = self.cfgfile.read_bytes()
+        except FileNotFoundError:
+            return []
+        key = self._cachekey(raw)
+        ondisk = self.ondisk
+        if ondisk is not None and ondisk[0] == key:
+            return []
+        try:
+            new = self._parse(raw, key)
+            # Diffing two parses keeps values toml cannot represent,
+            # like None, from showing up as changes.
+            old = self._parse(ondisk[1]) if ondisk is not None else {}
+        except ValueError as e:
+            log.warning(f'Could not parse {self.cfgfile}, changes not applied: {e}')
+            return []
+        if old and not new:
+            log.warning(f'{self.cfgfile} is empty, probably mid-write; changes not applied.')
+            return []
+        self.ondisk = (key, raw)
+        return list(_diff(old, new))
+
+    async def reload(self):
+        """Applies only what changed in the config file since it was last
+        read or written to the store, keeping unsaved changes to anything
+        else, and notifies subscribers of the changes applied.
+
+        Shards are reloaded as well, and shard keys edited into the
+        config file are moved into their shards.
+
+        Returns the list of ops applied.
+        """
+
+        ops = []
+        for shard in self.shards.values():
+            ops.extend(await shard.reload())
+        return ops + await self._reload()
+
+    async def _reload(self):
+        async with self.lock:
+            ops = await self.loop.run_in_executor(None, self._reread)
+            if not ops:
+                return ops
+            # Shard keys edited into the config file belong to their
+            # shards; dropping them from the file is not a change.
+            sharded = [op for op in ops if op[1][0] in self.shards and
+                       not (op[0] == 'del' and len(op[1]) == 1)]
+            ops = [op for op in ops if op[1][0] not in self.shards]
+            unsaved = self.snapshot() is not self.persisted
+            for op in ops:
+                _apply(self.store, op)
+            if self.journal:
+                # Journal records predating the edit must not be
+                # replayed on top of it; the edit is journaled as well,
+                # in case we crash before the journal is compacted.
+                snapshot = self.snapshot()
+                await self.loop.run_in_executor(None, self._log, self.persisted, snapshot)
+                self.persisted = snapshot
+                await self.loop.run_in_executor(None, self._compact)
+            elif not unsaved:
+                self.persisted = self.snapshot()
+                if sharded:
+                    # Drops the shard keys from the file right away.
+                    await self.loop.run_in_executor(None, self._write, self.persisted)
+        if ops:
+            log.info(f'Applied {len(ops)} changes from {self.cfgfile}.')
+            await self._notify(ops)
+        for key, shard in self.shards.items():
+            moved = [op for op in sharded if op[1][0] == key]
+            if moved:
+                log.info(f'Moving changes to {key} from {self.cfgfile} to {shard.cfgfile}.')
+                await shard._merge(moved)
+        return ops + sharded
+
+    async def _merge(self, ops):
+        """Applies ops that were made elsewhere, writes and notifies
+        subscribers of them, like a reload would.
+        """
+
+        async with self.lock:
+            for op in ops:
+                _apply(self.store, op)
+            await self._persist()
+        await self._notify(ops)
+
+    async def _notify(self, ops):
+        for callback in list(self.subscribers):
+            try:
+                result = callback(self, ops)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                log.exception(f'Error in subscriber for {self.cfgfile}!')
+
+    def _relay(self, shard, ops):
+        # Shard stores hold a single key, so their ops' paths
+        # are the same as they would be in this config.
+        return self._notify(ops)
+
     def __getitem__(self, key):
+        if key in self.shards:
+            return self.shards[key][key]
         return self.store[key]
 
     def __iter__(self):
-        return iter(self.store)
+        # Shard keys are never kept in the store, but should one slip in,
+        # it is still listed once, and the shard's value is the one used.
+        for key in self.store:
+            if key not in self.shards:
+                yield key
+        for key, shard in self.shards.items():
+            if key in shard.store:
+                yield key
 
     def __len__(self):
-        return len(self.store)
+        return sum(1 for _ in self)
 
     def __setitem__(self, key, value):
-        self.store[key] = value
+        if key in self.shards:
+            self.shards[key][key] = value
+        else:
+            self.store[key] = value
 
     def __delitem__(self, key):
-        del self.store[key]
+        if key in self.shards:
+            del self.shards[key][key]
+        else:
+            del self.store[key]
@@ -1,25 +1,168 @@
+import io
 import re
+import gzip
+import logging
+import discord
+from time import perf_counter
 from asyncio import TimeoutError
+from contextlib import asynccontextmanager
 from discord.ext import commands
 from utils import splitup
+from utils.outbound import schedule, INTERACTIVE, BULK
+from utils.progress import Progress
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+ATTACH_THRESHOLD = 8000
+PREVIEW_LINES = 10
+PREVIEW_CHARS = 800
+EXTENSIONS = {'': 'txt', 'markdown': 'md'}
+
+
+def _merge(first, second):
+    """Joins two messages; adjacent codeblocks with the same fence
+    are merged into a single codeblock.
+    """
+
+    fence = first[:first.find('\n') + 1]
+    if fence.startswith('```') and second.startswith(fence) and \
+            first.endswith('```') and second.endswith('```'):
+        return first[:-3] + second[len(fence):]
+    return f'{first}\n{second}'
+
+
+def _payload(text, compress):
+    """Streams text into an in-memory file, optionally gzipped;
+    returns the file, rewound, and its size.
+
+    Has to be an io.IOBase, discord.File tries to open anything else
+    as a path, which rules out SpooledTemporaryFile before Python 3.11.
+    """
+
+    payload = io.BytesIO()
+    out = gzip.GzipFile(fileobj=payload, mode='wb') if compress else payload
+    for start in range(0, len(text), 1 << 16):
+        out.write(text[start:start + (1 << 16)].encode())
+    if compress:
+        out.close()
+    size = payload.tell()
+    payload.seek(0)
+    return payload, size
+
+
+def _truthy(value):
+    return str(value).lower() in ('true', 'yes', 'y', '1')
 
 
 class CharfredContext(commands.Context):
+    def __init__(self, **attrs):
+        super().__init__(**attrs)
+        self.invoked_at = perf_counter()
+        self.priority = INTERACTIVE
+        self.coalesce = False
+        self.held = None
+        self.holdwindow = None
+        self.holdtimer = None
+
     def prompt_check(self, msg):
         return msg.author.id == self.author.id and msg.channel.id == self.channel.id
 
+    async def _waitreply(self, timeout):
+        """Waits for the author's next message in this channel,
+        through the bot's prompt router if it has one.
+        """
+
+        router = getattr(self.bot, 'prompts', None)
+        if router is None:
+            return await self.bot.wait_for('message', check=self.prompt_check, timeout=timeout)
+        return await router.wait(self.channel.id, self.author.id, timeout)
+
     async def send(self, msg=None, deletable=True, embed=None, codeblocked=False, **kwargs):
         """Helper function to send all sorts of things!
 
         Messages are automatically split into multiple messages if they're too long,
-        and if the codeblocked parameter is True codeblock formatting is
-        preserved when such a split occurs.
+        codeblock formatting is preserved when such a split occurs.
 
         Returns the message object for the sent message,
         if a split was performed only the last sent message is returned.
+        While coalescing, messages that are held back return None.
+
+        Sends go through the bot's outbound scheduler, with the context's
+        priority; all but the first part of split messages are bulk.
+
+        Messages longer than the configured attachment threshold are sent
+        as a single attachment with a short preview instead of being split.
+        """
+        if self.coalesce:
+            if msg is not None and embed is None and deletable and not kwargs:
+                if await self._hold(msg):
+                    return None
+            await self.flush()
+        return await self._send(msg, deletable, embed, codeblocked, **kwargs)
+
+    def _attachpolicy(self):
+        """Returns the attachment threshold and whether to gzip attachments,
+        as configured under cogcfgs.
         """
+
+        cogcfgs = self.bot.cfg['cogcfgs']
+        try:
+            threshold = int(cogcfgs[f'{__name__}.attachment_threshold'][0])
+        except (KeyError, TypeError, ValueError):
+            threshold = ATTACH_THRESHOLD
+        try:
+            compress = _truthy(cogcfgs[f'{__name__}.attachment_gzip'][0])
+        except (KeyError, TypeError):
+            compress = False
+        return threshold, compress
+
+    async def _attach(self, msg, deletable, priority, compress):
+        """Sends a message as an attachment, with a short preview."""
+
+        fence = ''
+        text = msg
+        if msg.startswith('```') and msg.endswith('```'):
+            fence = msg[:msg.find('\n')]
+            text = msg[len(fence) + 1:-3].rstrip('\n')
+        lang = fence[3:].strip()
+        ext = EXTENSIONS.get(lang, lang if lang.isalnum() else 'txt')
+        filename = f'output-{self.message.id}.{ext}'
+
+        limit = self.guild.filesize_limit if self.guild else 8 * 1024 * 1024
+        payload, size = await self.bot.loop.run_in_executor(None, _payload, text, compress)
+        if size > limit and not compress:
+            payload.close()
+            compress = True
+            payload, size = await self.bot.loop.run_in_executor(None, _payload, text, compress)
+        if compress:
+            filename += '.gz'
+
+        lines = text.count('\n') + 1
+        preview = '\n'.join(text[:PREVIEW_CHARS].splitlines()[:PREVIEW_LINES])
+        if fence:
+            preview = f'{fence}\n{preview}\n[...]\n```'
+        else:
+            preview = f'{preview}\n[...]'
+        if size > limit:
+            payload.close()
+            log.warning(f'Output of {self.message.id} too large to attach.')
+            return await self._send(f'{preview}\n```markdown\n< Output of {lines} lines '
+                                    'too large to attach! >\n```', deletable, priority=priority)
+        note = f'{preview}\n```markdown\n> {lines} lines, full output attached as {filename}.\n```'
+        return await self._send(note, deletable, priority=priority,
+                                file=discord.File(payload, filename=filename))
+
+    async def _send(self, msg=None, deletable=True, embed=None, codeblocked=False,
+                    priority=None, **kwargs):
+        if msg is not None and len(msg) > 2000 and 'file' not in kwargs:
+            threshold, compress = self._attachpolicy()
+            if threshold and len(msg) > threshold:
+                return await self._attach(msg, deletable, priority, compress)
         if (msg is None) or (len(msg) <= 2000):
-            outmsg = await super().send(content=msg, embed=embed, **kwargs)
+            send = super().send
+            outmsg = await schedule(self.bot, self.channel.id, 'send',
+                                    lambda: send(content=msg, embed=embed, **kwargs),
+                                    self.priority if priority is None else priority)
             if deletable:
                 try:
                     self.bot.cmd_map[self.message.id].output.append(outmsg)
@@ -29,11 +172,81 @@ class CharfredContext(commands.Context):
                     pass
             return outmsg
         else:
-            msgs = splitup(msg, codeblocked)
-            for msg in msgs:
-                outmsg = await self.send(msg, deletable, codeblocked=codeblocked)
+            # Chunks are split off lazily, the first is sent right away.
+            for num, msg in enumerate(splitup(msg)):
+                outmsg = await self._send(msg, deletable, codeblocked=codeblocked,
+                                          priority=BULK if num else priority)
             return outmsg
 
+    @asynccontextmanager
+    async def coalescing(self, window=None):
+        """Holds back text messages sent within the block and merges them
+        into as few messages as the length limit allows, which are sent
+        when the block is left, or window seconds after the first message
+        was held back, if a window is given.
+
+        Messages with embeds, files or other extras are sent right away,
+        after everything held back so far, to keep the order intact.
+        """
+
+        if self.coalesce:
+            yield self
+            return
+        self.coalesce = True
+        self.holdwindow = window
+        try:
+            yield self
+        finally:
+            self.coalesce = False
+            await self.flush()
+
+    async def _hold(self, msg):
+        if len(msg) > 2000:
+            return False
+        if self.held is not None:
+            merged = _merge(self.held, msg)
+            if len(merged) <= 2000:
+                self.held = merged
+                return True
+            await self.flush()
+        self.held = msg
+        if self.holdwindow and self.holdtimer is None:
+            self.holdtimer = self.bot.loop.call_later(
+                self.holdwindow, lambda: self.bot.loop.create_task(self.flush())
+            )
+        return True
+
+    async def flush(self):
+        """Sends all messages held back while coalescing."""
+
+        if self.holdtimer is not None:
+            self.holdtimer.cancel()
+            self.holdtimer = None
+        held, self.held = self.held, None
+        if held is not None:
+            await self._send(held, codeblocked=held.startswith('```'))
+
+    @asynccontextmanager
+    async def progress(self, status='Working...', interval=3.0):
+        """Sends a single progress message and keeps it updated while the block
+        runs, yielding a Progress to set its status, partial output and result.
+
+        Edits are throttled to one every interval seconds; when the block is
+        left, the message is edited in place to show the result, or failure
+        if the block raised.
+        """
+
+        await self.flush()
+        progress = Progress(self, status, interval)
+        await progress.start()
+        try:
+            yield progress
+        except BaseException:
+            await progress.close(failed=True)
+            raise
+        else:
+            await progress.close()
+
     async def sendmarkdown(self, msg, deletable=True):
         """Helper function that wraps a given message in markdown codeblocks
         and sends if off.
@@ -51,7 +264,7 @@ class CharfredContext(commands.Context):
 
         await self.sendmarkdown(prompt, deletable)
         try:
-            r = await self.bot.wait_for('message', check=self.prompt_check, timeout=timeout)
+            r = await self._waitreply(timeout)
         except TimeoutError:
             await self.sendmarkdown('> Prompt timed out!', deletable)
             return (None, None, True)
@@ -67,7 +280,7 @@ class CharfredContext(commands.Context):
 
         await self.sendmarkdown(prompt, deletable)
         try:
-            r = await self.bot.wait_for('message', check=self.prompt_check, timeout=timeout)
+            r = await self._waitreply(timeout)
         except TimeoutError:
             await self.sendmarkdown('> Prompt timed out!', deletable)
             return (None, None, True)
@@ -93,7 +306,7 @@ class CharfredContext(commands.Context):
 
         await self.sendmarkdown(prompt, deletable)
         try:
-            r = await self.bot.wait_for('message', check=self.prompt_check, timeout=timeout)
+            r = await self._waitreply(timeout)
         except TimeoutError:
             await self.sendmarkdown('> Prompt timed out!', deletable)
             return (None, None, True)
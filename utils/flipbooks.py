@@ -1,27 +1,76 @@
 import logging
 import asyncio
+import inspect
 import discord
+from bisect import bisect_right
+from itertools import islice
+from .collections import SizedDict
+from .outbound import schedule, INTERACTIVE, NORMAL, BULK
 
 log = logging.getLogger(f'charfred.{__name__}')
 
+# Discord's limits for embed descriptions and whole embeds.
+DESCRIPTION_LIMIT = 4096
+EMBED_LIMIT = 6000
+# Room left in an embed for footers.
+FOOTER_ROOM = 96
+
+
+def _truncate(text, limit):
+    if len(text) <= limit:
+        return text
+    return text[:limit - 1] + '…'
+
+
+def pack_pages(entries, budget):
+    """Returns the start index of every page, filling pages greedily with
+    as many entries as fit into budget characters, newlines included.
+
+    Entries longer than the budget get a page to themselves.
+    """
+
+    prefix = [0]
+    for entry in entries:
+        prefix.append(prefix[-1] + len(entry) + 1)
+    bounds = []
+    end = 0
+    while end < len(entries):
+        start = end
+        bounds.append(start)
+        end += 1
+        while end < len(entries) and prefix[end + 1] - prefix[start] - 1 <= budget:
+            end += 1
+    return bounds
+
 
 class Flipbook:
     """Allows splitting list entries into
     pages, that can be flipped through via
     reactions.
 
+    Pages hold entries_per_page entries, or, when packing, as many
+    entries as fit into an embed. Flipbooks with more than two pages
+    can also jump to a page and filter their entries.
+
     Heavily based on RoboDanny's Paginator."""
+
+    # Seconds without a button press before the Flipbook closes.
+    timeout = 120
+
     def __init__(self, ctx, entries, entries_per_page=16, title=None, color=None,
-                 close_on_exit=False):
+                 close_on_exit=False, pack=False):
         self.bot = ctx.bot
         self.ctx = ctx
         self.helping = False
         self.title = title
         self.entries = entries
         self.entries_per_page = entries_per_page
-        self.pages, odds = divmod(len(self.entries), self.entries_per_page)
-        if odds:
-            self.pages += 1
+        self.pack = pack
+        self.budget = min(DESCRIPTION_LIMIT, EMBED_LIMIT - len(title or '') - FOOTER_ROOM)
+        self.viewed = entries
+        self.query = None
+        self.index = None
+        self._paginate()
         if self.pages > 1:
             self.flipable = True
         else:
@@ -37,10 +86,90 @@ class Flipbook:
             ('❔', self.info),
             ('👉', self.flip_forward)
         ]
+        if self.pages > 2:
+            self.bttns += [('🔢', self.jump), ('🔍', self.search)]
+        self.actions = dict(self.bttns)
+        self.lock = asyncio.Lock()
+        self.buttons = None
+
+    def _outbound(self, route, factory, priority=INTERACTIVE, supersede=None):
+        return schedule(self.bot, self.msg.channel.id, route, factory, priority, supersede)
+
+    def _edit(self, **fields):
+        # Only the latest edit matters, queued ones are dropped.
+        return self._outbound('edit', lambda: self.msg.edit(**fields), supersede=self.msg.id)
+
+    async def _add_reactions(self, bttns):
+        # Queued all at once, the outbound scheduler keeps them in order.
+        await asyncio.gather(*[
+            self._outbound('react', lambda bttn=bttn: self.msg.add_reaction(bttn))
+            for bttn in bttns
+        ])
+
+    def _add_buttons(self, bttns):
+        """Adds reactions in the background, so the page is usable
+        while they are still coming in.
+        """
+
+        async def add():
+            try:
+                await self._add_reactions(bttns)
+            except discord.HTTPException as e:
+                log.warning(f'Could not add Flipbook buttons: {e}')
+
+        self.buttons = self.bot.loop.create_task(add())
+
+    def _clear_reactions(self):
+        return self._outbound('react', self.msg.clear_reactions)
+
+    def _paginate(self):
+        if self.pack:
+            self.bounds = pack_pages(self.viewed, self.budget)
+        else:
+            self.bounds = list(range(0, len(self.viewed), self.entries_per_page))
+        self.pages = len(self.bounds)
 
     def flip_entries(self, page):
-        start = page * self.entries_per_page
-        return self.entries[start:start + self.entries_per_page]
+        start = self.bounds[page]
+        end = self.bounds[page + 1] if page + 1 < self.pages else len(self.viewed)
+        return self.viewed[start:end]
+
+    def _text(self, entry):
+        return entry
+
+    def _matches(self, query):
+        """Returns the indices of all entries containing query, ignoring case.
+
+        Searches a lowercased copy of all entries, joined into one string,
+        which is built once, on the first search.
+        """
+
+        if self.index is None:
+            texts = [self._text(entry).lower() for entry in self.entries]
+            starts = []
+            offset = 0
+            for text in texts:
+                starts.append(offset)
+                offset += len(text) + 1
+            self.index = ('\0'.join(texts), starts)
+        haystack, starts = self.index
+        needle = query.lower()
+        matches = []
+        pos = haystack.find(needle)
+        while pos != -1:
+            num = bisect_right(starts, pos) - 1
+            matches.append(num)
+            if num + 1 == len(starts):
+                break
+            pos = haystack.find(needle, starts[num + 1])
+        return matches
+
+    def _footer(self, page):
+        footer = f'Page {page} of {self.pages - 1}'
+        if self.query is not None:
+            footer += f' (filtered by "{_truncate(self.query, 32)}": ' \
+                f'{len(self.viewed)} of {len(self.entries)})'
+        return footer
 
     async def draw_page(self, page, first=False):
         if page < 0 or page > (self.pages - 1):
@@ -55,21 +184,22 @@ class Flipbook:
         if self.title:
             self.embed.title = self.title
 
-        if self.pages > 1:
-            self.embed.set_footer(text=f'Page {page} of {self.pages - 1}')
+        if self.pages > 1 or self.query is not None:
+            self.embed.set_footer(text=self._footer(page))
         else:
             self.embed.set_footer(text=u'Got it all on one page! ╭( ･ㅂ･)و')
 
-        self.embed.description = '\n'.join(content)
+        self.embed.description = _truncate('\n'.join(content), self.budget)
+        await self._show(first)
 
+    async def _show(self, first):
         if first:
             self.msg = await self.ctx.send(embed=self.embed)
 
             if self.flipable:
-                for (bttn, _) in self.bttns:
-                    await self.msg.add_reaction(bttn)
+                self._add_buttons([bttn for (bttn, _) in self.bttns])
         else:
-            await self.msg.edit(embed=self.embed)
+            await self._edit(embed=self.embed)
 
     async def flip_back(self):
         await self.draw_page(self.current_page - 1)
@@ -77,12 +207,55 @@ class Flipbook:
     async def flip_forward(self):
         await self.draw_page(self.current_page + 1)
 
+    async def _ask(self, prompt):
+        """Prompts the author, returns their reply or None;
+        both prompt and reply are cleaned up afterwards.
+        """
+
+        question = await self.ctx.sendmarkdown(f'> {prompt}')
+        try:
+            reply = await self.ctx._waitreply(30)
+        except asyncio.TimeoutError:
+            reply = None
+        for msg in (question, reply):
+            if msg is not None:
+                try:
+                    await self._outbound('delete', msg.delete, BULK)
+                except discord.HTTPException:
+                    pass
+        return reply.content.strip() if reply else None
+
+    async def jump(self):
+        page = await self._ask(f'Jump to which page? (0 - {self.pages - 1})')
+        try:
+            page = int(page)
+        except (TypeError, ValueError):
+            return
+        await self.draw_page(min(max(page, 0), self.pages - 1))
+
+    async def search(self):
+        query = await self._ask('Filter entries by what? (* shows everything again)')
+        if not query:
+            return
+        if query == '*':
+            self.query = None
+            self.viewed = self.entries
+        else:
+            matches = self._matches(query)
+            if not matches:
+                await self.ctx.sendmarkdown(f'< Nothing matches "{query}"! >')
+                return
+            self.query = query
+            self.viewed = [self.entries[num] for num in matches]
+        self._paginate()
+        await self.draw_page(0)
+
     async def flip_off(self):
         self.flipable = False
         if self.close_on_exit:
-            await self.msg.edit(embed=None,
-                                content='```markdown\n> FlipBook closed!\n```')
-        await self.msg.clear_reactions()
+            await self._edit(embed=None,
+                             content='```markdown\n> FlipBook closed!\n```')
+        await self._clear_reactions()
 
     async def info(self):
         if self.helping:
@@ -98,64 +271,112 @@ class Flipbook:
                 'Flip Charfred off: 🖕 (closes Flipbook)',
                 'Toggle this help: ❔'
             ]
+            if '🔢' in self.actions:
+                content[4:4] = ['Jump to a page: 🔢', 'Filter entries: 🔍']
 
             infoEmbed = discord.Embed(color=discord.Color.blurple())
             infoEmbed.title = 'Charfred Flipbook Instructions:'
             infoEmbed.description = '\n'.join(content)
-            await self.msg.clear_reactions()
-            await self.msg.edit(embed=infoEmbed)
-            await self.msg.add_reaction('❔')
-            await self.msg.add_reaction('🖕')
+            await self._clear_reactions()
+            await self._edit(embed=infoEmbed)
+            self._add_buttons(('❔', '🖕'))
+
+    def _action(self, reaction, user):
+        """Returns the action for a reaction, if it is one of our buttons
+        pressed by the author.
+        """
+
+        if user.id != self.ctx.author.id:
+            return None
+        return self.actions.get(str(reaction.emoji))
+
+    async def react(self, reaction, user):
+        """Handles a reaction on the Flipbook; returns whether it was a button."""
+
+        action = self._action(reaction, user)
+        if action is None:
+            return False
+        async with self.lock:
+            try:
+                await self._outbound('react', lambda: self.msg.remove_reaction(reaction, user),
+                                     NORMAL)
+            except:
+                pass
+            if self.flipable:
+                await action()
+        return True
+
+    async def expire(self):
+        self.flipable = False
+        async with self.lock:
+            try:
+                await self.flip_off()
+            except discord.HTTPException:
+                pass
 
     async def flip(self):
         await self.draw_page(0, first=True)
+        if not self.flipable:
+            return
+
+        router = getattr(self.bot, 'flipbooks', None)
+        if router is not None:
+            # The router dispatches reactions and expires the Flipbook.
+            router.register(self)
+            return
 
         def check(reaction, user):
             if reaction.message.id != self.msg.id:
                 return False
-
-            if user.id != self.ctx.author.id:
-                return False
-
-            for (bttn, func) in self.bttns:
-                if str(reaction.emoji) == bttn:
-                    self.action = func
-                    return True
-            return False
+            return self._action(reaction, user) is not None
 
         while self.flipable:
             try:
-                reaction, user = await self.bot.wait_for('reaction_add', timeout=120, check=check)
+                reaction, user = await self.bot.wait_for('reaction_add', timeout=self.timeout,
+                                                         check=check)
             except asyncio.TimeoutError:
-                self.flipable = False
-                self.action = self.flip_off
-                try:
-                    await self.msg.clear_reactions()
-                except:
-                    pass
+                await self.expire()
             else:
-                try:
-                    await self.msg.remove_reaction(reaction, user)
-                except:
-                    pass
-            await self.action()
+                await self.react(reaction, user)
 
 
 class EmbedFlipbook(Flipbook):
     """Flipbook, but for flipping through
-    a list of embeds!"""
+    a list of embeds!
+
+    Embeds over Discord's size limits get their description cut short."""
+    def _paginate(self):
+        self.pages = len(self.viewed)
+
+    def _text(self, embed):
+        texts = [embed.title, embed.description]
+        for field in embed.fields:
+            texts += [field.name, field.value]
+        return '\n'.join(text for text in texts if isinstance(text, str))
+
+    def _fit(self, embed):
+        description = embed.description if isinstance(embed.description, str) else ''
+        limit = min(DESCRIPTION_LIMIT,
+                    len(description) - (len(embed) - EMBED_LIMIT + FOOTER_ROOM))
+        if len(description) <= limit:
+            return embed
+        embed = embed.copy()
+        embed.description = _truncate(description, max(limit, 1))
+        return embed
+
     async def draw_page(self, page, first=False):
         if page < 0 or page > (self.pages - 1):
             return
 
         self.current_page = page
-        self.embed = self.entries[page]
+        self.embed = self.viewed[page]
 
         if self.title:
             self.embed.title = self.title
+        self.embed = self._fit(self.embed)
 
-        if self.pages > 1:
-            self.embed.set_footer(text=f'Page {page} of {self.pages - 1}')
+        if self.pages > 1 or self.query is not None:
+            self.embed.set_footer(text=self._footer(page))
         else:
             self.embed.set_footer(text=u'Got it all on one page! ╭( ･ㅂ･)و\n'
                                   'Wait... why make a Flipbook for just one embed?')
@@ -163,7 +384,150 @@ class EmbedFlipbook(Flipbook):
         if first:
             self.msg = await self.ctx.send(embed=self.embed)
 
-            for (bttn, _) in self.bttns:
-                await self.msg.add_reaction(bttn)
+            self._add_buttons([bttn for (bttn, _) in self.bttns])
+        else:
+            await self._edit(embed=self.embed)
+
+
+class LazyFlipbook(Flipbook):
+    """Flipbook that pulls its entries page by page, instead of
+    needing all of them up front.
+
+    The source is either a sync or async iterable of entries, or a
+    callback taking a page number and the entries per page, returning
+    (or returning an awaitable of) that page's entries; empty for pages
+    past the end.
+
+    The first page is shown as soon as its entries are in, the next one
+    is prefetched in the background; only the last window rendered pages
+    are kept. Pages that dropped out of the window are fetched again,
+    iterables are iterated again from the start for this, unless they
+    are one-shot iterators, whose pages are gone for good.
+    """
+
+    def __init__(self, ctx, source, entries_per_page=16, title=None, color=None,
+                 close_on_exit=False, window=8):
+        super().__init__(ctx, [], entries_per_page, title, color, close_on_exit)
+        self.source = source
+        self.fetcher = callable(source) and not hasattr(source, '__iter__') \
+            and not hasattr(source, '__aiter__')
+        self.cache = SizedDict(max_size=window)
+        self.iterator = None
+        self.restartable = True
+        self.position = 0
+        self.exhausted = False
+        self.fetching = asyncio.Lock()
+        self.prefetching = None
+
+    def _restart(self):
+        if not self.restartable:
+            return False
+        if hasattr(self.source, '__aiter__'):
+            self.iterator = self.source.__aiter__()
         else:
-            await self.msg.edit(embed=self.embed)
+            self.iterator = iter(self.source)
+        self.restartable = self.iterator is not self.source
+        self.position = 0
+        return True
+
+    async def _chunk(self):
+        if not hasattr(self.iterator, '__anext__'):
+            return list(islice(self.iterator, self.entries_per_page))
+        entries = []
+        while len(entries) < self.entries_per_page:
+            try:
+                entries.append(await self.iterator.__anext__())
+            except StopAsyncIteration:
+                break
+        return entries
+
+    def _seen(self, page, entries):
+        """Keeps track of how many pages there are, as far as known."""
+
+        if entries:
+            self.pages = max(self.pages, page + 1)
+        if len(entries) < self.entries_per_page:
+            self.exhausted = True
+            self.pages = page + 1 if entries else min(self.pages, page)
+
+    async def fetch_page(self, page):
+        """Returns the rendered page, None if it is past the end,
+        or False if it can not be fetched again.
+        """
+
+        try:
+            content = self.cache[page]
+        except KeyError:
+            pass
+        else:
+            self.cache[page] = content
+            return content
+
+        async with self.fetching:
+            if page in self.cache:
+                return self.cache[page]
+            if self.exhausted and page >= self.pages:
+                return None
+
+            if self.fetcher:
+                entries = self.source(page, self.entries_per_page)
+                if inspect.isawaitable(entries):
+                    entries = await entries
+                entries = list(entries)
+                self._seen(page, entries)
+                if not entries:
+                    return None
+                self.cache[page] = '\n'.join(entries)
+                return self.cache[page]
+
+            if self.iterator is None or page < self.position:
+                if not self._restart():
+                    return False
+            while self.position <= page:
+                entries = await self._chunk()
+                self._seen(self.position, entries)
+                if not entries:
+                    return None
+                self.cache[self.position] = '\n'.join(entries)
+                self.position += 1
+                if len(entries) < self.entries_per_page:
+                    break
+            return self.cache.get(page)
+
+    def _prefetch(self, page):
+        if page in self.cache or (self.exhausted and page >= self.pages):
+            return
+        if self.prefetching is not None and not self.prefetching.done():
+            return
+        self.prefetching = self.bot.loop.create_task(self._prefetched(page))
+
+    async def _prefetched(self, page):
+        try:
+            await self.fetch_page(page)
+        except Exception:
+            log.exception(f'Prefetching page {page} failed!')
+
+    async def draw_page(self, page, first=False):
+        if page < 0:
+            return
+        content = await self.fetch_page(page)
+        if content is None and not first:
+            return
+        if content is False:
+            content = '> This page is no longer in memory!'
+
+        self.current_page = page
+        if self.title:
+            self.embed.title = self.title
+        if not self.exhausted:
+            self.embed.set_footer(text=f'Page {page}, more to come...')
+        elif self.pages > 1:
+            self.embed.set_footer(text=f'Page {page} of {self.pages - 1}')
+        else:
+            self.embed.set_footer(text=u'Got it all on one page! ╭( ･ㅂ･)و')
+        self.embed.description = _truncate(content, self.budget) if content else 'Nothing to show!'
+
+        if first:
+            self.flipable = not self.exhausted or self.pages > 1
+        await self._show(first)
+        self._prefetch(page + 1)
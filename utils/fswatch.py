@@ -0,0 +1,200 @@
+import os
+import ctypes
+import ctypes.util
+import asyncio
+import logging
+import struct
+import weakref
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_IGNORED = 0x8000
+IN_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_event = struct.Struct('iIII')
+
+
+def _ref(callback):
+    """Bound methods are only held weakly, so watching a file does not
+    keep the watching object alive.
+    """
+
+    if hasattr(callback, '__self__'):
+        return weakref.WeakMethod(callback)
+    return lambda: callback
+
+
+class _Watcher:
+    """Base for file watchers; keeps the callbacks per watched path
+    and calls them with the path whenever that file changed.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.watched = {}
+
+    def watch(self, path, callback):
+        path = os.path.abspath(path)
+        self.watched.setdefault(path, []).append(_ref(callback))
+        return path
+
+    def unwatch(self, path, callback):
+        path = os.path.abspath(path)
+        refs = self.watched.get(path, [])
+        refs[:] = [ref for ref in refs if ref() not in (None, callback)]
+        if not refs:
+            self.watched.pop(path, None)
+
+    def _notify(self, path):
+        refs = self.watched.get(path)
+        if not refs:
+            return
+        for ref in list(refs):
+            callback = ref()
+            if callback is None:
+                refs.remove(ref)
+                continue
+            try:
+                callback(path)
+            except Exception:
+                log.exception(f'Error in watch callback for {path}!')
+
+    def close(self):
+        self.watched.clear()
+
+
+class PollingWatcher(_Watcher):
+    """Watches files by comparing their mtime, size and inode
+    every interval seconds.
+    """
+
+    def __init__(self, loop, interval=2.0):
+        super().__init__(loop)
+        self.interval = interval
+        self.stamps = {}
+        self.poller = None
+
+    def _stamp(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def watch(self, path, callback):
+        path = super().watch(path, callback)
+        if path not in self.stamps:
+            self.stamps[path] = self._stamp(path)
+        if self.poller is None:
+            self.poller = self.loop.create_task(self._poll())
+        return path
+
+    def unwatch(self, path, callback):
+        super().unwatch(path, callback)
+        for path in list(self.stamps):
+            if path not in self.watched:
+                del self.stamps[path]
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            for path, stamp in list(self.stamps.items()):
+                current = self._stamp(path)
+                if current != stamp:
+                    self.stamps[path] = current
+                    self._notify(path)
+
+    def close(self):
+        super().close()
+        self.stamps.clear()
+        if self.poller:
+            self.poller.cancel()
+            self.poller = None
+
+
+class InotifyWatcher(_Watcher):
+    """Watches files through inotify, reading events on the loop.
+
+    The directories containing the files are watched, not the files
+    themselves, since files replaced by a rename are new inodes.
+    """
+
+    def __init__(self, loop):
+        super().__init__(loop)
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._init = libc.inotify_init1
+        self._init.argtypes = [ctypes.c_int]
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.dirs = {}
+        self.wds = {}
+        try:
+            loop.add_reader(self.fd, self._read)
+        except NotImplementedError:
+            os.close(self.fd)
+            raise
+
+    def watch(self, path, callback):
+        path = super().watch(path, callback)
+        dirpath = os.path.dirname(path)
+        if dirpath not in self.wds:
+            wd = self._add_watch(self.fd, os.fsencode(dirpath), IN_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                self.unwatch(path, callback)
+                raise OSError(errno, os.strerror(errno), dirpath)
+            self.dirs[wd] = dirpath
+            self.wds[dirpath] = wd
+        return path
+
+    def _read(self):
+        try:
+            buf = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        changed = []
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = _event.unpack_from(buf, offset)
+            offset += _event.size
+            name = buf[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_IGNORED:
+                dirpath = self.dirs.pop(wd, None)
+                self.wds.pop(dirpath, None)
+                continue
+            try:
+                path = os.path.join(self.dirs[wd], os.fsdecode(name))
+            except KeyError:
+                continue
+            if path in self.watched and path not in changed:
+                changed.append(path)
+        for path in changed:
+            self._notify(path)
+
+    def close(self):
+        super().close()
+        if self.fd >= 0:
+            self.loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = -1
+
+
+def make_watcher(loop, interval=2.0):
+    """Returns an inotify watcher where inotify is available,
+    or a polling watcher otherwise.
+    """
+
+    try:
+        return InotifyWatcher(loop)
+    except (OSError, AttributeError, TypeError, NotImplementedError):
+        log.info(f'inotify unavailable, polling for file changes every {interval}s.')
+        return PollingWatcher(loop, interval)
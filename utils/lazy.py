@@ -0,0 +1,29 @@
+import sys
+import importlib.util
+
+
+def lazy_import(name):
+    """Returns a module that is only actually executed on first
+    attribute access.
+
+    Raises ImportError right away if the module cannot be found,
+    so optional dependencies can still be checked for at import time.
+    """
+
+    try:
+        return sys.modules[name]
+    except KeyError:
+        pass
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f'No module named {name!r}', name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
@@ -0,0 +1,175 @@
+from bisect import bisect_left
+
+# Upper bounds of the latency buckets, in seconds;
+# anything above the last bound lands in an overflow bucket.
+LATENCY_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                  1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram.
+
+    Only bucket counts, the sum and the count of observed values
+    are kept, so memory use does not grow with the number of observations.
+    Percentiles are approximated by the upper bound of the bucket
+    they fall into.
+    """
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, p):
+        """Returns the upper bound of the bucket containing the p-th percentile,
+        inf if it is in the overflow bucket and None if nothing was observed.
+        """
+
+        if not self.count:
+            return None
+        rank = self.count * p / 100
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class CommandStats:
+    """Counters and latency histogram for a single command."""
+
+    __slots__ = ('calls', 'completed', 'failed', 'latency')
+
+    def __init__(self):
+        self.calls = 0
+        self.completed = 0
+        self.failed = 0
+        self.latency = Histogram()
+
+
+class MetricsRegistry:
+    """Registry of per-command metrics, keyed by qualified command name."""
+
+    def __init__(self):
+        self.commands = {}
+
+    def __getitem__(self, name):
+        try:
+            return self.commands[name]
+        except KeyError:
+            stats = self.commands[name] = CommandStats()
+            return stats
+
+    def __iter__(self):
+        return iter(self.commands.items())
+
+    def __len__(self):
+        return len(self.commands)
+
+    def started(self, name):
+        self[name].calls += 1
+
+    def completed(self, name, duration):
+        stats = self[name]
+        stats.completed += 1
+        stats.latency.observe(duration)
+
+    def failed(self, name, duration):
+        stats = self[name]
+        stats.failed += 1
+        stats.latency.observe(duration)
+
+    def reset(self):
+        self.commands.clear()
+
+
+def format_latency(seconds):
+    """Formats a percentile as returned by Histogram.percentile."""
+
+    if seconds is None:
+        return 'n/a'
+    if seconds == float('inf'):
+        return f'>{LATENCY_BOUNDS[-1]:g}s'
+    if seconds < 1:
+        return f'<{seconds * 1000:g}ms'
+    return f'<{seconds:g}s'
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_family(name, kind, helptext, samples):
+    """Renders a single metric family in Prometheus text format.
+
+    Samples are (labels, value) pairs, with labels being a preformatted
+    label string, which may be empty.
+    """
+
+    lines = [f'# HELP {name} {helptext}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def _histogram(name, labels, hist):
+    lines = []
+    sep = ',' if labels else ''
+    cumulative = 0
+    for bound, count in zip(hist.bounds, hist.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {hist.count}')
+    lines.append(f'{name}_sum{{{labels}}} {hist.sum}' if labels else f'{name}_sum {hist.sum}')
+    lines.append(f'{name}_count{{{labels}}} {hist.count}' if labels else f'{name}_count {hist.count}')
+    return lines
+
+
+def render_histograms(name, helptext, samples):
+    """Renders a histogram family in Prometheus text format,
+    from (labels, Histogram) pairs.
+    """
+
+    lines = [f'# HELP {name} {helptext}', f'# TYPE {name} histogram']
+    for labels, hist in samples:
+        lines.extend(_histogram(name, labels, hist))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def render_commands(registry, batch=50):
+    """Yields the command metrics in Prometheus text format, in chunks
+    of at most batch commands per metric family, so that large registries
+    can be written out incrementally.
+    """
+
+    commands = [(f'command="{_label(name)}"', stats) for name, stats in registry]
+    counters = (
+        ('charfred_command_calls_total', 'Commands invoked.', 'calls'),
+        ('charfred_command_completed_total', 'Commands completed.', 'completed'),
+        ('charfred_command_failed_total', 'Commands failed.', 'failed')
+    )
+    for name, helptext, attr in counters:
+        yield f'# HELP {name} {helptext}\n# TYPE {name} counter\n'
+        for i in range(0, len(commands), batch):
+            yield ''.join(f'{name}{{{labels}}} {getattr(stats, attr)}\n'
+                          for labels, stats in commands[i:i + batch])
+
+    name = 'charfred_command_duration_seconds'
+    yield f'# HELP {name} Command latency.\n# TYPE {name} histogram\n'
+    for i in range(0, len(commands), batch):
+        lines = []
+        for labels, stats in commands[i:i + batch]:
+            lines.extend(_histogram(name, labels, stats.latency))
+        lines.append('')
+        yield '\n'.join(lines)
@@ -1,25 +1,112 @@
-def splitup(msg, codeblocked=False):
-    lines = msg.splitlines(keepends=True)
-
-    if codeblocked:
-        front = lines[0]
-        back = lines[-1]
-        lines = lines[1:-1]
-    else:
-        front = ''
-        back = ''
-
-    msgs = []
-    count = 1900
-    lastidx = 0
-    for idx, line in enumerate(lines):
-        if (count := count - len(line)) < 0:
-            msg = front + ''.join(lines[lastidx:idx]) + back
-            msgs.append(msg)
-            count = 1900
-            lastidx = idx
-
-    return msgs
+def _lines(text):
+    """Yields the lines of a text, with their line endings,
+    without splitting the whole text up front.
+    """
+
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start) + 1 or len(text)
+        yield text[start:end]
+        start = end
+
+
+def _fencing(fence, line):
+    """Returns the fence open after the given line, given the one open before it."""
+
+    stripped = line.strip()
+    if not stripped.startswith('```'):
+        return fence
+    if fence is None:
+        if len(stripped) > 3 and stripped.endswith('```') and stripped.count('```') > 1:
+            return None
+        return stripped
+    if stripped.strip('`') == '':
+        return None
+    return fence
+
+
+def splitup(msg, codeblocked=False, limit=2000):
+    """Yields a message in chunks of at most limit characters, lazily.
+
+    Chunks are split between lines where possible, lines too long for
+    a chunk of their own are hard-wrapped, and the pieces are tracked
+    like lines of their own. Code fences are tracked, so a codeblock
+    spanning several chunks is closed at the end of each chunk and
+    reopened, with the same fence, at the start of the next; fences
+    longer than a quarter of the limit are reopened as a bare fence.
+
+    The codeblocked flag is only kept for callers that still pass it,
+    fences are tracked either way.
+    """
+
+    cap = max(3, limit // 4)
+    fence = None
+    opener = None
+    chunk = []
+    size = 0
+    header = 0
+    wrapped = False
+
+    def emit():
+        last = chunk[-1].strip() if chunk else None
+        if fence is not None and opener == len(chunk) - 1 and last == reopen(fence)[:-1]:
+            # Nothing made it into the block yet, it moves to the next chunk.
+            text = ''.join(chunk[:-1])
+            closing = ''
+        else:
+            text = ''.join(chunk)
+            closing = '\n```' if fence is not None else ''
+        if text.endswith('\n'):
+            text = text[:-1]
+        text += closing
+        # Blank messages cannot be sent.
+        if text.strip():
+            yield text
+
+    def reopen(fence):
+        return (fence if len(fence) <= cap else '```') + '\n'
+
+    for line in _lines(msg):
+        while line:
+            after = _fencing(fence, line)
+            reserve = 4 if after is not None else 0
+            if not wrapped and size + len(line) + reserve <= limit:
+                piece, line = line, ''
+            elif size > header:
+                # Does not fit behind what the chunk holds already, or
+                # is the rest of a hard-wrapped line, which always
+                # starts the next chunk.
+                closing = fence is not None and after is None
+                yield from emit()
+                opener = None
+                wrapped = False
+                if closing:
+                    # The chunk was closed already, no need for an empty block.
+                    fence = None
+                    chunk, size, header = [], 0, 0
+                    break
+                chunk = [reopen(fence)] if fence is not None else []
+                size = header = len(chunk[0]) if chunk else 0
+                continue
+            else:
+                # Does not fit into a chunk of its own either; room is
+                # left to close whatever fence may be open after the
+                # piece, and the rest must not start like a fence.
+                room = limit - size
+                if fence is not None or line.lstrip().startswith('```'):
+                    room -= 4
+                while room > 1 and line[room:].lstrip().startswith('```'):
+                    room -= 1
+                piece, line = line[:room], line[room:]
+                after = _fencing(fence, piece)
+                wrapped = bool(line)
+            chunk.append(piece)
+            size += len(piece)
+            if fence is None and after is not None:
+                opener = len(chunk) - 1
+            fence = after
+    if size > header:
+        yield from emit()
 
 
 class cached_property:
@@ -0,0 +1,203 @@
+import heapq
+import asyncio
+import logging
+from itertools import count
+from time import monotonic
+from .metrics import Histogram
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+# Priorities, lowest goes first.
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+PRIORITIES = {INTERACTIVE: 'interactive', NORMAL: 'normal', BULK: 'bulk'}
+
+# Requests allowed per route and channel, as (burst, per seconds);
+# a bit below what Discord allows, so we rarely ever hit a 429.
+ROUTES = {
+    'send': (5, 5.0),
+    'edit': (5, 5.0),
+    'react': (1, 0.3),
+    'delete': (5, 5.0)
+}
+
+
+class TokenBucket:
+    """Token bucket, refilling rate tokens per second up to capacity."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'stamp')
+
+    def __init__(self, capacity, per):
+        self.rate = capacity / per
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self, now):
+        """Returns the seconds until a token is available."""
+
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class Job:
+    __slots__ = ('priority', 'seq', 'route', 'factory', 'future', 'key', 'queued')
+
+    def __init__(self, priority, seq, route, factory, future, key):
+        self.priority = priority
+        self.seq = seq
+        self.route = route
+        self.factory = factory
+        self.future = future
+        self.key = key
+        self.queued = monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundScheduler:
+    """Schedules outgoing requests per channel, proactively keeping them
+    within Discord's rate limits instead of running into 429s.
+
+    Every channel has a priority queue, worked off one request at a time,
+    and a token bucket per route; interactive requests go ahead of bulk
+    ones. Requests submitted with a supersede key replace any request with
+    the same key that is still queued, which then resolves to None.
+    """
+
+    def __init__(self, loop, routes=ROUTES, maxbuckets=1000):
+        self.loop = loop
+        self.routes = routes
+        self.maxbuckets = maxbuckets
+        self.queues = {}
+        self.workers = {}
+        self.running = {}
+        self.buckets = {}
+        self.keyed = {}
+        self.seq = count()
+        self.waits = {priority: Histogram() for priority in PRIORITIES}
+        self.submitted = 0
+        self.superseded = 0
+
+    @property
+    def depth(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def submit(self, channel_id, route, factory, priority=NORMAL, supersede=None):
+        """Queues a request; factory is called without arguments once it is
+        the request's turn, and has to return an awaitable.
+
+        Returns a future resolving to the request's result.
+        """
+
+        future = self.loop.create_future()
+        job = Job(priority, next(self.seq), route, factory, future,
+                  (channel_id, supersede) if supersede is not None else None)
+        if job.key is not None:
+            old = self.keyed.get(job.key)
+            if old is not None and not old.future.done():
+                old.future.set_result(None)
+                self.superseded += 1
+            self.keyed[job.key] = job
+        heapq.heappush(self.queues.setdefault(channel_id, []), job)
+        self.submitted += 1
+        if channel_id not in self.workers:
+            self.workers[channel_id] = self.loop.create_task(self._work(channel_id))
+        return future
+
+    def _bucket(self, channel_id, route):
+        try:
+            return self.buckets[(channel_id, route)]
+        except KeyError:
+            pass
+        if len(self.buckets) >= self.maxbuckets:
+            self._prune()
+        bucket = self.buckets[(channel_id, route)] = TokenBucket(*self.routes[route])
+        return bucket
+
+    def _prune(self):
+        """Drops all buckets that have refilled completely,
+        they are no different from new ones.
+        """
+
+        now = monotonic()
+        for key, bucket in list(self.buckets.items()):
+            bucket.delay(now)
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[key]
+
+    async def _work(self, channel_id):
+        queue = self.queues[channel_id]
+        try:
+            while queue:
+                job = queue[0]
+                if job.future.done():
+                    heapq.heappop(queue)
+                    self._forget(job)
+                    continue
+                bucket = self._bucket(channel_id, job.route)
+                delay = bucket.delay(monotonic())
+                if delay:
+                    # Something more urgent may come in meanwhile,
+                    # so the head of the queue is looked at again.
+                    await asyncio.sleep(delay)
+                    continue
+                heapq.heappop(queue)
+                self._forget(job)
+                bucket.take()
+                self.waits[job.priority].observe(monotonic() - job.queued)
+                self.running[channel_id] = job
+                try:
+                    result = await job.factory()
+                except Exception as e:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    if not job.future.done():
+                        job.future.set_result(result)
+                finally:
+                    del self.running[channel_id]
+        finally:
+            del self.workers[channel_id]
+            if not queue:
+                del self.queues[channel_id]
+
+    def _forget(self, job):
+        if job.key is not None and self.keyed.get(job.key) is job:
+            del self.keyed[job.key]
+
+    def close(self):
+        """Stops all workers, cancelling the futures of all requests
+        still queued or in flight, so noone waits on them forever.
+        """
+
+        for worker in list(self.workers.values()):
+            worker.cancel()
+        jobs = list(self.running.values())
+        for queue in self.queues.values():
+            jobs.extend(queue)
+        for job in jobs:
+            if not job.future.done():
+                job.future.cancel()
+
+
+def schedule(bot, channel_id, route, factory, priority=NORMAL, supersede=None):
+    """Submits a request to the bot's outbound scheduler, or just makes
+    the request if the bot has none; either way, returns an awaitable.
+    """
+
+    outbound = getattr(bot, 'outbound', None)
+    if outbound is None:
+        return factory()
+    return outbound.submit(channel_id, route, factory, priority, supersede)
@@ -1,29 +1,165 @@
+import logging
 from discord.ext import commands
-from discord.utils import find
+from .collections import SizedDict
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+
+def _rank(role):
+    """Sort key for roles, same order as discord.py's role comparisons:
+    by position, the lower id wins ties, @everyone is always lowest.
+    """
+
+    if role.id == role.guild.id:
+        return (-1, 0)
+    return (role.position, -role.id)
+
+
+def rank_role_id(guild, rank):
+    """Returns the id of the role a rank was computed from."""
+
+    return guild.id if rank == (-1, 0) else -rank[1]
+
+
+class GuildIndex:
+    """Precomputed permission data for a single guild.
+
+    Roles are ranked by position, ids only break ties.
+    """
+
+    __slots__ = ('roles', 'ranked', 'minimums')
+
+    def __init__(self, guild, hierarchy):
+        self.roles = {}
+        self.ranked = {}
+        # Lowest positioned role wins if names are not unique,
+        # same as searching guild.roles from the bottom up.
+        for role in guild.roles:
+            self.roles.setdefault(role.name, role)
+            if role.name in hierarchy:
+                self.ranked[role.id] = _rank(role)
+        self.minimums = {}
+
+
+def permits(minimum, rank):
+    """Decides a node, given its minimum as returned by
+    NodeResolver.minimum and a rank as returned by NodeResolver.rank.
+    """
+
+    if minimum is True or minimum is False:
+        return minimum
+    return rank is not None and rank >= minimum
+
+
+class NodeResolver:
+    """Resolves permission nodes for guild members.
+
+    Per guild, roles are indexed by name and the minimum rank for every node
+    is computed once; per member, the rank of their highest role in the
+    hierarchy is memoised, so checking a node is a couple of dict lookups.
+
+    Guild indices have to be invalidated whenever the guild's roles,
+    the configured nodes or the hierarchy change, member ranks
+    whenever the member's roles change.
+    """
+
+    def __init__(self, bot, maxmembers=10000):
+        self.bot = bot
+        self.guilds = {}
+        self.ranks = SizedDict(max_size=maxmembers)
+
+    def _index(self, guild):
+        try:
+            return self.guilds[guild.id]
+        except KeyError:
+            index = GuildIndex(guild, set(self.bot.cfg['hierarchy']))
+            self.guilds[guild.id] = index
+            log.debug(f'Indexed roles for {guild.id}.')
+            return index
+
+    def minimum(self, guild, node):
+        """Returns True if anyone may use the node, False if noone but
+        the owner may, or the minimum rank required otherwise.
+        """
+
+        index = self._index(guild)
+        try:
+            return index.minimums[node]
+        except KeyError:
+            pass
+        roleName = self.bot.cfg['nodes'].get(node)
+        if not roleName:
+            minimum = False
+        elif roleName == '@everyone':
+            minimum = True
+        else:
+            role = index.roles.get(roleName)
+            minimum = _rank(role) if role else False
+        index.minimums[node] = minimum
+        return minimum
+
+    def rank(self, member, memoise=True):
+        """Returns the rank of the member's highest role in the hierarchy,
+        or None if none of their roles are in it.
+        """
+
+        key = (member.guild.id, member.id)
+        try:
+            return self.ranks[key]
+        except KeyError:
+            pass
+        ranked = self._index(member.guild).ranked
+        ranks = [ranked[role.id] for role in member.roles if role.id in ranked]
+        rank = max(ranks) if ranks else None
+        if memoise:
+            self.ranks[key] = rank
+        return rank
+
+    def allowed(self, member, node):
+        minimum = self.minimum(member.guild, node)
+        if minimum is True or minimum is False:
+            return minimum
+        return permits(minimum, self.rank(member))
+
+    def invalidate(self, guild_id=None):
+        """Drops everything known about a given guild,
+        or about all guilds if no guild id is given.
+        """
+
+        if guild_id is None:
+            self.guilds.clear()
+            self.ranks.clear()
+        else:
+            self.guilds.pop(guild_id, None)
+            for key in [key for key in self.ranks if key[0] == guild_id]:
+                del self.ranks[key]
+
+    def invalidate_member(self, member):
+        self.ranks.pop((member.guild.id, member.id), None)
+
+    def invalidate_node(self, node):
+        for index in self.guilds.values():
+            index.minimums.pop(node, None)
+
+    def cfg_changed(self, cfg, ops):
+        """Config subscriber, invalidating all guilds if nodes
+        or the hierarchy were changed in the config file.
+        """
+
+        if any(op[1][0] in ('nodes', 'hierarchy') for op in ops):
+            self.invalidate()
 
 
 async def node_check(ctx, node):
-    is_owner = await ctx.bot.is_owner(ctx.author)
+    is_owner = ctx.bot.cached_is_owner(ctx.author)
+    if is_owner is None:
+        is_owner = await ctx.bot.is_owner(ctx.author)
     if is_owner:
         return True
 
-    try:
-        if not ctx.bot.cfg['nodes'][node]:
-            return False
-    except KeyError:
-        return False
-
-    roleName = ctx.bot.cfg['nodes'][node]
-    if roleName == '@everyone':
-        return True
-    else:
-        minRole = find(lambda r: r.name == roleName, ctx.guild.roles)
-        if minRole:
-            hierarchy = set(ctx.bot.cfg['hierarchy'])
-            roles = [r for r in ctx.author.roles if r.name in hierarchy]
-            if roles:
-                return roles[-1] >= minRole
+    if ctx.guild is None:
         return False
+    return ctx.bot.resolver.allowed(ctx.author, node)
 
 
 def permission_node(node):
@@ -0,0 +1,75 @@
+import re
+import logging
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+
+class PrefixIndex:
+    """Per-guild index of precompiled prefix matchers.
+
+    Every guild gets a single compiled pattern, matching the bot mentions
+    and all of the guild's configured prefixes, in the order they are
+    configured, so matching a message costs one dict lookup and one match.
+
+    Patterns are compiled lazily and kept until invalidated, which has to
+    happen whenever the configured prefixes change.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.matchers = {}
+        self.mentions = None
+
+    def _compile(self, guild_id):
+        if self.mentions is None:
+            bot_id = self.bot.user.id
+            self.mentions = (f'<@{bot_id}> ', f'<@!{bot_id}> ')
+        prefixes = list(self.mentions)
+        if guild_id is not None:
+            try:
+                prefixes.extend(self.bot.cfg['prefix'][str(guild_id)])
+            except KeyError:
+                pass
+        matcher = re.compile('|'.join(map(re.escape, prefixes))).match
+        self.matchers[guild_id] = matcher
+        log.debug(f'Compiled prefix matcher for {guild_id}.')
+        return matcher
+
+    def match(self, msg):
+        """Returns the prefix the given message starts with,
+        or None if it does not start with any known prefix.
+        """
+
+        guild_id = msg.guild.id if msg.guild else None
+        try:
+            matcher = self.matchers[guild_id]
+        except KeyError:
+            matcher = self._compile(guild_id)
+        match = matcher(msg.content)
+        if match:
+            return match.group()
+        return None
+
+    def invalidate(self, guild_id=None):
+        """Drops the compiled matcher for a given guild,
+        or for all guilds if no guild id is given.
+        """
+
+        if guild_id is None:
+            self.matchers.clear()
+        else:
+            self.matchers.pop(int(guild_id), None)
+
+    def cfg_changed(self, cfg, ops):
+        """Config subscriber, invalidating the matchers of all guilds
+        whose prefixes were changed in the config file.
+        """
+
+        for op in ops:
+            path = op[1]
+            if path[0] != 'prefix':
+                continue
+            if len(path) > 1:
+                self.invalidate(path[1])
+            else:
+                self.invalidate()
@@ -0,0 +1,83 @@
+import json
+import logging
+from time import perf_counter
+from functools import wraps
+from contextlib import contextmanager
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+
+class StartupTimeline:
+    """Records named phases of the startup sequence,
+    relative to a given origin.
+    """
+
+    def __init__(self, origin=None):
+        self.origin = perf_counter() if origin is None else origin
+        self.phases = []
+
+    def record(self, name, start, end):
+        self.phases.append((name, start - self.origin, end - start))
+
+    @contextmanager
+    def phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, perf_counter())
+
+    def timed(self, name, func):
+        """Wraps a callable so that every call is recorded as a phase."""
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def report(self):
+        """Returns the recorded phases as lines of text, slowest first."""
+
+        total = perf_counter() - self.origin
+        lines = [f'Startup took {total:.3f}s:',
+                 f'{"duration":>10} {"start":>9}  phase']
+        for name, start, duration in sorted(self.phases, key=lambda p: p[2], reverse=True):
+            lines.append(f'{duration * 1000:>8.1f}ms {start:>8.3f}s  {name}')
+        return lines
+
+    def dump(self, path):
+        data = {
+            'total': perf_counter() - self.origin,
+            'phases': [{'name': name, 'start': start, 'duration': duration}
+                       for name, start, duration in self.phases]
+        }
+        with open(path, 'w') as out:
+            json.dump(data, out, indent=2)
+        log.info(f'Startup timeline written to {path}.')
+
+
+class TimedLoader:
+    """Loader proxy recording the time spent executing a module,
+    and in its setup function, if it has one.
+    """
+
+    def __init__(self, loader, timeline, name):
+        self.loader = loader
+        self.timeline = timeline
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(self.loader, attr)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        module.__loader__ = self.loader
+        module.__spec__.loader = self.loader
+        with self.timeline.phase(f'import {self.name}'):
+            self.loader.exec_module(module)
+        setup = getattr(module, 'setup', None)
+        if setup is not None:
+            module.setup = self.timeline.timed(f'setup {self.name}', setup)
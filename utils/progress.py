@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from collections import deque
+from time import perf_counter
+from utils.outbound import schedule
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+OUTPUT_CHARS = 1700
+
+
+class Progress:
+    """A single message showing the status, elapsed time and latest output
+    of a long running operation.
+
+    Updates are cheap; the message is edited at most once every interval
+    seconds, always with the latest state, and finally edited in place
+    with the result when the operation is done.
+    """
+
+    def __init__(self, ctx, status, interval=3.0, lines=10):
+        self.ctx = ctx
+        self.status = status
+        self.interval = interval
+        self.output = deque(maxlen=lines)
+        self.started = perf_counter()
+        self.lastedit = 0.0
+        self.msg = None
+        self.result = None
+        self.editor = None
+        self.ticker = None
+
+    @property
+    def elapsed(self):
+        return perf_counter() - self.started
+
+    def render(self):
+        text = f'# {self.status}\n> {self.elapsed:.1f}s elapsed'
+        if self.output:
+            text += '\n' + '\n'.join(self.output)[-OUTPUT_CHARS:]
+        return f'```markdown\n{text}\n```'
+
+    async def start(self):
+        self.msg = await self.ctx._send(self.render())
+        self.lastedit = perf_counter()
+        self.ticker = self.ctx.bot.loop.create_task(self._tick())
+
+    def update(self, status=None, output=None):
+        """Sets a new status and/or adds lines of partial output;
+        the message is edited once the throttle allows it.
+        """
+
+        if status is not None:
+            self.status = status
+        if output:
+            self.output.extend(output.rstrip('\n').splitlines())
+        if self.msg is not None and (self.editor is None or self.editor.done()):
+            self.editor = self.ctx.bot.loop.create_task(self._edit())
+
+    def finish(self, msg, markdown=True):
+        """Sets the result the message is edited to once the block is left."""
+
+        self.result = f'```markdown\n{msg}\n```' if markdown else msg
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.update()
+
+    async def _edit(self):
+        delay = self.lastedit + self.interval - perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.lastedit = perf_counter()
+        # Rendered once it is the edit's turn, so it is never stale.
+        await self._apply(lambda: self.msg.edit(content=self.render()))
+
+    async def _apply(self, factory):
+        try:
+            await schedule(self.ctx.bot, self.ctx.channel.id, 'edit', factory,
+                           self.ctx.priority, supersede=self.msg.id)
+        except Exception:
+            log.exception('Could not edit progress message!')
+
+    async def close(self, failed=False):
+        """Stops updating and edits the message to its final state."""
+
+        for task in (self.ticker, self.editor):
+            if task is not None and not task.done():
+                task.cancel()
+        if self.msg is None:
+            return
+        if failed:
+            result = f'```markdown\n< Failed after {self.elapsed:.1f}s: {self.status} >\n```'
+        elif self.result is None:
+            self.status = 'Done!'
+            result = self.render()
+        else:
+            result = self.result
+        if len(result) <= 2000:
+            await self._apply(lambda: self.msg.edit(content=result))
+            return
+        # Too long to fit, the rest goes after the progress message.
+        await self._apply(lambda: self.msg.edit(
+            content=f'```markdown\n# Done after {self.elapsed:.1f}s, output below:\n```'
+        ))
+        await self.ctx.send(result, codeblocked=result.startswith('```'))
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+
+class PromptRouter:
+    """Routes incoming messages to pending prompts.
+
+    Prompts are keyed by (channel id, author id), so dispatching a message
+    is a single dict lookup, no matter how many prompts are open; unlike
+    wait_for, which runs the check of every pending prompt on every message.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.pending = {}
+
+    def __len__(self):
+        return sum(len(futures) for futures in self.pending.values())
+
+    async def wait(self, channel_id, author_id, timeout=None):
+        """Waits for the next message by the given author in the given channel.
+
+        Raises asyncio.TimeoutError if none arrives within timeout seconds;
+        timed out or cancelled prompts are removed right away.
+        """
+
+        key = (channel_id, author_id)
+        future = self.loop.create_future()
+        self.pending.setdefault(key, []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            futures = self.pending.get(key)
+            if futures is not None:
+                try:
+                    futures.remove(future)
+                except ValueError:
+                    pass
+                if not futures:
+                    del self.pending[key]
+
+    def dispatch(self, message):
+        """Resolves all prompts waiting for the given message.
+
+        Returns True if there were any.
+        """
+
+        futures = self.pending.pop((message.channel.id, message.author.id), None)
+        if not futures:
+            return False
+        for future in futures:
+            if not future.done():
+                future.set_result(message)
+        return True
@@ -0,0 +1,177 @@
+from copy import deepcopy
+
+
+class Tracked:
+    """Mixin for containers that keep a cached, frozen copy of themselves.
+
+    Any mutation drops the cached copy of the container and of all
+    its ancestors, so freezing a tree only rebuilds the containers that
+    changed since the last freeze; everything else is shared with the
+    previous frozen copy.
+    """
+
+    __slots__ = ()
+
+    def _touch(self):
+        node = self
+        while node is not None and node._frozen is not None:
+            node._frozen = None
+            node = node._parent
+
+    def _adopt(self, value):
+        return track(value, self)
+
+
+class TrackedDict(Tracked, dict):
+    __slots__ = ('_parent', '_frozen')
+
+    def __init__(self, parent=None):
+        self._parent = parent
+        self._frozen = None
+
+    def __deepcopy__(self, memo):
+        return {key: deepcopy(value, memo) for key, value in self.items()}
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def __setitem__(self, key, value):
+        self._touch()
+        super().__setitem__(key, self._adopt(value))
+
+    def __delitem__(self, key):
+        self._touch()
+        super().__delitem__(key)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def pop(self, *args):
+        self._touch()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._touch()
+        return super().popitem()
+
+    def clear(self):
+        self._touch()
+        super().clear()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+
+class TrackedList(Tracked, list):
+    __slots__ = ('_parent', '_frozen')
+
+    def __init__(self, parent=None):
+        self._parent = parent
+        self._frozen = None
+
+    def __deepcopy__(self, memo):
+        return [deepcopy(value, memo) for value in self]
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+    def __setitem__(self, index, value):
+        self._touch()
+        if isinstance(index, slice):
+            value = [self._adopt(v) for v in value]
+        else:
+            value = self._adopt(value)
+        super().__setitem__(index, value)
+
+    def __delitem__(self, index):
+        self._touch()
+        super().__delitem__(index)
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, n):
+        self._touch()
+        return super().__imul__(n)
+
+    def append(self, value):
+        self._touch()
+        super().append(self._adopt(value))
+
+    def extend(self, values):
+        self._touch()
+        super().extend([self._adopt(v) for v in values])
+
+    def insert(self, index, value):
+        self._touch()
+        super().insert(index, self._adopt(value))
+
+    def pop(self, *args):
+        self._touch()
+        return super().pop(*args)
+
+    def remove(self, value):
+        self._touch()
+        super().remove(value)
+
+    def clear(self):
+        self._touch()
+        super().clear()
+
+    def sort(self, *args, **kwargs):
+        self._touch()
+        super().sort(*args, **kwargs)
+
+    def reverse(self):
+        self._touch()
+        super().reverse()
+
+
+def track(value, parent=None):
+    """Wraps dicts and lists, recursively, into tracked containers
+    belonging to the given parent.
+
+    Tracked containers that already belong to another parent are copied,
+    since a container can only propagate changes to a single parent.
+    """
+
+    if isinstance(value, Tracked):
+        if value._parent is None or value._parent is parent:
+            value._parent = parent
+            return value
+    if isinstance(value, dict):
+        node = TrackedDict(parent)
+        for key, item in value.items():
+            dict.__setitem__(node, key, track(item, node))
+        return node
+    if isinstance(value, list):
+        node = TrackedList(parent)
+        list.extend(node, [track(item, node) for item in value])
+        return node
+    return value
+
+
+def freeze(value):
+    """Returns a plain, frozen copy of a tracked container.
+
+    Frozen copies are cached and shared between freezes, as long as
+    the container does not change, and must never be mutated.
+    """
+
+    if isinstance(value, TrackedDict):
+        if value._frozen is None:
+            value._frozen = {key: freeze(item) for key, item in dict.items(value)}
+        return value._frozen
+    if isinstance(value, TrackedList):
+        if value._frozen is None:
+            value._frozen = [freeze(item) for item in list.__iter__(value)]
+        return value._frozen
+    return value
@@ -0,0 +1,78 @@
+import sys
+import time
+import logging
+import threading
+import traceback
+from datetime import datetime
+from collections import deque, namedtuple
+
+log = logging.getLogger(f'charfred.{__name__}')
+
+Stall = namedtuple('Stall', 'when duration stack')
+
+
+class LoopWatchdog(threading.Thread):
+    """Watchdog thread measuring event loop responsiveness.
+
+    Every interval a callback is scheduled on the loop; if the loop has
+    not run it within threshold seconds, the stack of the loop's thread is
+    captured and, once the loop responds again, the stall is logged and
+    kept in a ring buffer.
+
+    Has to be created from the thread running the loop.
+    """
+
+    def __init__(self, loop, threshold=0.5, interval=0.25, maxstalls=25):
+        super().__init__(name='charfred-watchdog', daemon=True)
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = deque(maxlen=maxstalls)
+        self.lock = threading.Lock()
+        self.total = 0
+        self.loopthread = threading.get_ident()
+        self.beat = threading.Event()
+        self.stopping = threading.Event()
+
+    def stop(self):
+        self.stopping.set()
+
+    def recent(self):
+        """Returns a copy of the recorded stalls, most recent first;
+        the ring buffer itself is appended to from the watchdog thread.
+        """
+
+        with self.lock:
+            return list(reversed(self.stalls))
+
+    def clear(self):
+        with self.lock:
+            self.stalls.clear()
+
+    def _capture(self):
+        frame = sys._current_frames().get(self.loopthread)
+        if frame is None:
+            return 'Stack unavailable!'
+        return ''.join(traceback.format_stack(frame))
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.beat.clear()
+            sent = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(self.beat.set)
+            except RuntimeError:
+                log.info('Event loop closed, watchdog stopping.')
+                return
+            if self.beat.wait(self.threshold):
+                continue
+
+            stack = self._capture()
+            while not self.beat.wait(self.interval):
+                if self.stopping.is_set():
+                    return
+            duration = time.monotonic() - sent
+            with self.lock:
+                self.stalls.append(Stall(datetime.now(), duration, stack))
+                self.total += 1
+            log.warning(f'Event loop stalled for {duration:.3f}s, blocked in:\n{stack}')